@@ -0,0 +1,83 @@
+"""Preallocated replay storage for the off-policy Jitterbug benchmarks"""
+
+import numpy as np
+
+from stable_baselines.common.buffers import ReplayBuffer
+
+
+class ContiguousReplayBuffer(ReplayBuffer):
+    """A replay buffer backed by preallocated contiguous arrays
+
+    The stock stable-baselines buffer keeps a Python list of per-transition
+    tuples and re-stacks a fresh batch of arrays on every sample. Here the
+    storage is one structure-of-arrays allocation per field (float32, with
+    a circular write index), made once and never freed: adds are in-place
+    row writes with no allocator churn, and samples are fancy-indexed
+    gathers from contiguous memory.
+    """
+
+    def __init__(self, size):
+        """Constructor
+
+        Args:
+            size (int): Maximum number of transitions to store. Storage for
+                all fields is allocated on the first add, once the
+                observation/action shapes are known
+        """
+        super(ContiguousReplayBuffer, self).__init__(size)
+        self._size = 0
+        self._allocated = False
+
+    def _allocate(self, obs_t, action):
+        """Allocate the SoA storage blocks from a prototype transition"""
+        size = self._maxsize
+        self.observations = np.empty(
+            (size,) + np.shape(obs_t), dtype=np.float32)
+        self.actions = np.empty(
+            (size,) + np.shape(action), dtype=np.float32)
+        self.rewards = np.empty((size,), dtype=np.float32)
+        self.next_observations = np.empty_like(self.observations)
+        self.dones = np.empty((size,), dtype=np.float32)
+        self._allocated = True
+
+    def __len__(self):
+        return self._size
+
+    def add(self, obs_t, action, reward, obs_tp1, done):
+        if not self._allocated:
+            self._allocate(obs_t, action)
+
+        i = self._next_idx
+        self.observations[i] = obs_t
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_observations[i] = obs_tp1
+        self.dones[i] = done
+
+        self._next_idx = (i + 1) % self._maxsize
+        self._size = min(self._size + 1, self._maxsize)
+
+    def extend(self, obs_t, action, reward, obs_tp1, done):
+        for data in zip(obs_t, action, reward, obs_tp1, done):
+            self.add(*data)
+
+    def sample(self, batch_size, **_kwargs):
+        """Sample a batch of transitions
+
+        One vectorized randint draw plus one gather per field; no per-sample
+        Python loop.
+
+        Args:
+            batch_size (int): Number of transitions to sample
+
+        Returns:
+            (tuple): Batched (obs_t, action, reward, obs_tp1, done) arrays
+        """
+        idx = np.random.randint(0, self._size, size=batch_size)
+        return (
+            self.observations[idx],
+            self.actions[idx],
+            self.rewards[idx],
+            self.next_observations[idx],
+            self.dones[idx]
+        )
@@ -0,0 +1,549 @@
+"""Vectorized environment utilities for the Jitterbug benchmarks"""
+
+import multiprocessing
+
+import numpy as np
+
+from stable_baselines.common.vec_env import VecEnv, CloudpickleWrapper
+
+
+def _grouped_worker(remote, parent_remote, env_fn_wrappers):
+    """Worker loop stepping a group of envs sequentially in one process"""
+
+    parent_remote.close()
+    envs = [fn() for fn in env_fn_wrappers.var]
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+
+            if cmd == 'step':
+
+                # data is a (num_envs_in_group, act_dim) action slice
+                obs, rews, dones, infos = [], [], [], []
+                for env, action in zip(envs, data):
+                    ob, rew, done, info = env.step(action)
+                    if done:
+                        ob = env.reset()
+                    obs.append(ob)
+                    rews.append(rew)
+                    dones.append(done)
+                    infos.append(info)
+
+                # One pipe send per group instead of one per env
+                remote.send((
+                    np.stack(obs),
+                    np.array(rews),
+                    np.array(dones),
+                    infos
+                ))
+
+            elif cmd == 'reset':
+                remote.send(np.stack([env.reset() for env in envs]))
+
+            elif cmd == 'get_spaces':
+                remote.send((envs[0].observation_space, envs[0].action_space))
+
+            elif cmd == 'close':
+                for env in envs:
+                    env.close()
+                remote.close()
+                break
+
+            else:
+                raise NotImplementedError(
+                    "Unknown command {}".format(cmd)
+                )
+
+    except KeyboardInterrupt:
+        pass
+
+
+def _shmem_worker(remote, parent_remote, env_fn_wrapper, obs_buf,
+                  obs_shape, obs_dtype):
+    """Worker loop writing observations into a shared-memory block"""
+
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    obs_view = np.frombuffer(obs_buf, dtype=obs_dtype).reshape(obs_shape)
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+
+            if cmd == 'step':
+                obs, rew, done, info = env.step(data)
+                if done:
+                    obs = env.reset()
+
+                # Only the scalars travel through the pipe; the
+                # observation is already in shared memory
+                obs_view[...] = obs
+                remote.send((rew, done, info))
+
+            elif cmd == 'reset':
+                obs_view[...] = env.reset()
+                remote.send(None)
+
+            elif cmd == 'close':
+                env.close()
+                remote.close()
+                break
+
+            else:
+                raise NotImplementedError(
+                    "Unknown command {}".format(cmd)
+                )
+
+    except KeyboardInterrupt:
+        pass
+
+
+class ShmemVecEnv(VecEnv):
+    """A SubprocVecEnv variant with shared-memory observation transport
+
+    stable-baselines ships no shared-memory vec env, so this vendors the
+    openai/baselines design: each worker writes its observation into a
+    preallocated shared block and only the (reward, done, info) scalars
+    travel through the pipe, removing the per-step observation pickling
+    that dominates SubprocVecEnv rollout time for a fast env like the
+    Jitterbug.
+    """
+
+    def __init__(self, env_fns):
+        """Constructor
+
+        Args:
+            env_fns (list): List of no-argument callables that construct
+                the envs. Must have a Box observation space
+        """
+
+        # Build one env up front to discover the spaces, so the shared
+        # blocks can be sized before the workers start
+        probe_env = env_fns[0]()
+        observation_space = probe_env.observation_space
+        action_space = probe_env.action_space
+        probe_env.close()
+
+        obs_shape = tuple(observation_space.shape)
+        obs_dtype = np.dtype(observation_space.dtype)
+        ctype = np.ctypeslib.as_ctypes_type(obs_dtype)
+
+        self.waiting = False
+        self.closed = False
+
+        ctx = multiprocessing.get_context('fork')
+        self._obs_bufs = [
+            ctx.Array(ctype, int(np.prod(obs_shape)), lock=False)
+            for _ in range(len(env_fns))
+        ]
+        self._obs_views = [
+            np.frombuffer(buf, dtype=obs_dtype).reshape(obs_shape)
+            for buf in self._obs_bufs
+        ]
+
+        self.remotes, self.work_remotes = zip(*[
+            ctx.Pipe()
+            for _ in range(len(env_fns))
+        ])
+        self.processes = []
+        for work_remote, remote, env_fn, obs_buf in zip(
+                self.work_remotes,
+                self.remotes,
+                env_fns,
+                self._obs_bufs
+        ):
+            process = ctx.Process(
+                target=_shmem_worker,
+                args=(
+                    work_remote,
+                    remote,
+                    CloudpickleWrapper(env_fn),
+                    obs_buf,
+                    obs_shape,
+                    obs_dtype
+                ),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        super(ShmemVecEnv, self).__init__(
+            len(env_fns),
+            observation_space,
+            action_space
+        )
+
+    def step_async(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rews, dones, infos = zip(*results)
+
+        # np.stack copies out of the shared blocks, so the returned
+        # arrays are fresh per the VecEnv contract
+        return (
+            np.stack(self._obs_views),
+            np.array(rews),
+            np.array(dones),
+            list(infos)
+        )
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        for remote in self.remotes:
+            remote.recv()
+        return np.stack(self._obs_views)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        raise NotImplementedError
+
+    def set_attr(self, attr_name, value, indices=None):
+        raise NotImplementedError
+
+    def env_method(self, method_name, *method_args, indices=None,
+                  **method_kwargs):
+        raise NotImplementedError
+
+    def seed(self, seed=None):
+        raise NotImplementedError
+
+
+class GroupedSubprocVecEnv(VecEnv):
+    """A SubprocVecEnv variant that runs several envs per subprocess
+
+    Running `envs_per_proc` envs sequentially inside each worker amortizes
+    the per-step pipe round-trip over several env steps, and averaging the
+    group's episodes hides stragglers. For a fast env like the Jitterbug
+    this gives a higher total env count with the same number of pipes
+    synchronized per step.
+    """
+
+    def __init__(self, env_fns, envs_per_proc=1):
+        """Constructor
+
+        Args:
+            env_fns (list): List of no-argument callables that construct the
+                envs. Must have a length divisible by `envs_per_proc`
+
+            envs_per_proc (int): Number of envs to run sequentially inside
+                each worker process
+        """
+
+        assert len(env_fns) % envs_per_proc == 0, \
+            "len(env_fns) ({}) must be divisible by envs_per_proc ({})".format(
+                len(env_fns),
+                envs_per_proc
+            )
+
+        self.envs_per_proc = envs_per_proc
+        self.num_procs = len(env_fns) // envs_per_proc
+        self.waiting = False
+        self.closed = False
+
+        ctx = multiprocessing.get_context('fork')
+        self.remotes, self.work_remotes = zip(*[
+            ctx.Pipe()
+            for _ in range(self.num_procs)
+        ])
+        self.processes = []
+        for work_remote, remote, group_start in zip(
+                self.work_remotes,
+                self.remotes,
+                range(0, len(env_fns), envs_per_proc)
+        ):
+            group = env_fns[group_start:group_start + envs_per_proc]
+            process = ctx.Process(
+                target=_grouped_worker,
+                args=(work_remote, remote, CloudpickleWrapper(group)),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(('get_spaces', None))
+        observation_space, action_space = self.remotes[0].recv()
+        super(GroupedSubprocVecEnv, self).__init__(
+            len(env_fns),
+            observation_space,
+            action_space
+        )
+
+    def step_async(self, actions):
+        actions = np.asarray(actions)
+        for remote, group_start in zip(
+                self.remotes,
+                range(0, self.num_envs, self.envs_per_proc)
+        ):
+            remote.send((
+                'step',
+                actions[group_start:group_start + self.envs_per_proc]
+            ))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        obs, rews, dones, infos = zip(*results)
+        return (
+            np.concatenate(obs),
+            np.concatenate(rews),
+            np.concatenate(dones),
+            [info for group in infos for info in group]
+        )
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        return np.concatenate([remote.recv() for remote in self.remotes])
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        raise NotImplementedError
+
+    def set_attr(self, attr_name, value, indices=None):
+        raise NotImplementedError
+
+    def env_method(self, method_name, *method_args, indices=None,
+                  **method_kwargs):
+        raise NotImplementedError
+
+    def seed(self, seed=None):
+        raise NotImplementedError
+
+
+class BatchedVecEnv(VecEnv):
+    """An in-process batched VecEnv with SoA observation assembly
+
+    Holds all envs in the calling process and steps them in a tight loop,
+    writing each observation straight into a preallocated (N, obs_dim)
+    contiguous block (structure-of-arrays), so the policy feed sees one
+    contiguous float array per global step and no IPC happens at all.
+    Appropriate when env.step is cheap relative to pipe round-trips, as it
+    is for the Jitterbug physics.
+    """
+
+    def __init__(self, env_fns):
+        """Constructor
+
+        Args:
+            env_fns (list): List of no-argument callables that construct
+                the envs
+        """
+        self.envs = [fn() for fn in env_fns]
+        env = self.envs[0]
+        super(BatchedVecEnv, self).__init__(
+            len(self.envs),
+            env.observation_space,
+            env.action_space
+        )
+
+        self._obs_block = np.zeros(
+            (self.num_envs,) + tuple(env.observation_space.shape),
+            dtype=env.observation_space.dtype
+        )
+        self._rew_block = np.zeros((self.num_envs,), dtype=np.float32)
+        self._done_block = np.zeros((self.num_envs,), dtype=np.bool_)
+        self._actions = None
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions)
+
+    def step_wait(self):
+        infos = []
+        for i, env in enumerate(self.envs):
+            obs, rew, done, info = env.step(self._actions[i])
+            if done:
+                obs = env.reset()
+            self._obs_block[i] = obs
+            self._rew_block[i] = rew
+            self._done_block[i] = done
+            infos.append(info)
+
+        # Return copies per the VecEnv contract: the PPO2 runner stores the
+        # returned rewards/dones arrays by reference in its rollout
+        # minibatch, so handing out the live staging buffers would alias
+        # every stored row to the final step (cf. DummyVecEnv.step_wait)
+        return (
+            self._obs_block.copy(),
+            self._rew_block.copy(),
+            self._done_block.copy(),
+            infos
+        )
+
+    def reset(self):
+        for i, env in enumerate(self.envs):
+            self._obs_block[i] = env.reset()
+        return self._obs_block.copy()
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(env, attr_name) for env in self.envs]
+
+    def set_attr(self, attr_name, value, indices=None):
+        for env in self.envs:
+            setattr(env, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None,
+                  **method_kwargs):
+        return [
+            getattr(env, method_name)(*method_args, **method_kwargs)
+            for env in self.envs
+        ]
+
+    def seed(self, seed=None):
+        return [env.seed(seed) for env in self.envs]
+
+    def make_in_graph_step(self, action_op):
+        """Build TF ops that step this batched env inside the graph
+
+        Embeds step() behind a tf.py_func so an entire rollout can be
+        collected inside a tf.while_loop with a single session.run,
+        instead of paying one session round-trip per env step (the
+        BatchPPO InGraphBatchEnv pattern). The stock stable-baselines
+        PPO2 runner drives the env from Python and cannot consume these
+        ops; this is an extension point for custom in-graph rollout
+        loops.
+
+        Args:
+            action_op (tf.Tensor): A (num_envs, act_dim) float32 action
+                tensor
+
+        Returns:
+            (tuple): (obs, reward, done) float32 tensors produced by
+                stepping every env with the given actions
+        """
+        import tensorflow as tf
+
+        def _step(actions):
+            obs, rews, dones, _ = self.step(actions)
+            return (
+                obs.astype(np.float32),
+                rews.astype(np.float32),
+                dones.astype(np.float32)
+            )
+
+        obs, rew, done = tf.py_func(
+            _step,
+            [action_op],
+            [tf.float32, tf.float32, tf.float32],
+            name="batched_env_step"
+        )
+        obs.set_shape(
+            (self.num_envs,) + tuple(self.observation_space.shape))
+        rew.set_shape((self.num_envs,))
+        done.set_shape((self.num_envs,))
+        return obs, rew, done
+
+
+class SingleEnvVecEnv(VecEnv):
+    """A zero-copy VecEnv shim around a single environment
+
+    DummyVecEnv with one env still runs its generic list/stack/copy loop on
+    every step. The SAC/DDPG/TD3 paths only ever use one env, so this shim
+    forwards step/reset directly, staging results in preallocated (1, ...)
+    buffers and returning copies of them per the VecEnv contract.
+    """
+
+    def __init__(self, env_fn):
+        """Constructor
+
+        Args:
+            env_fn (callable or gym.Env): The environment to wrap, or a
+                no-argument callable constructing it
+        """
+        env = env_fn() if callable(env_fn) else env_fn
+        self.env = env
+
+        # Kept for DummyVecEnv-compatible access patterns
+        self.envs = [env]
+
+        super(SingleEnvVecEnv, self).__init__(
+            1,
+            env.observation_space,
+            env.action_space
+        )
+
+        self._obs_buf = np.zeros(
+            (1,) + tuple(env.observation_space.shape),
+            dtype=env.observation_space.dtype
+        )
+        self._rew_buf = np.zeros((1,), dtype=np.float32)
+        self._done_buf = np.zeros((1,), dtype=np.bool_)
+        self._actions = None
+
+    def step_async(self, actions):
+        self._actions = actions
+
+    def step_wait(self):
+        obs, rew, done, info = self.env.step(self._actions[0])
+        if done:
+            obs = self.env.reset()
+        self._obs_buf[0] = obs
+        self._rew_buf[0] = rew
+        self._done_buf[0] = done
+
+        # Return copies per the VecEnv contract: callers store the
+        # returned arrays by reference (see BatchedVecEnv.step_wait)
+        return (
+            self._obs_buf.copy(),
+            self._rew_buf.copy(),
+            self._done_buf.copy(),
+            [info]
+        )
+
+    def reset(self):
+        self._obs_buf[0] = self.env.reset()
+        return self._obs_buf.copy()
+
+    def close(self):
+        self.env.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self.env, attr_name)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self.env, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None,
+                  **method_kwargs):
+        return [getattr(self.env, method_name)(*method_args, **method_kwargs)]
+
+    def seed(self, seed=None):
+        return [self.env.seed(seed)]
+
+    def render(self, *args, **kwargs):
+        return self.env.render(*args, **kwargs)
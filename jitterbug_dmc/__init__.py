@@ -48,5 +48,9 @@ from jitterbug_dmc.jitterbug import (
     demo
 )
 
-from jitterbug_dmc.gym_wrapper import JitterbugGymEnv
+from jitterbug_dmc.gym_wrapper import (
+    JitterbugGymEnv,
+    Float32ObservationWrapper,
+    SingleKeyDictWrapper
+)
 import jitterbug_dmc.heuristic_policies
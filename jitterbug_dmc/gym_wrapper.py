@@ -1,8 +1,71 @@
 """Provides an OpenAI Gym compatible env wrapper for the Jitterbug domain"""
 
+import gym
+import numpy as np
+
 import dm2gym
 
 
+class Float32ObservationWrapper(gym.ObservationWrapper):
+    """Casts observations to float32 at the env boundary
+
+    RL frameworks (e.g. stable-baselines) operate in float32 internally,
+    while dm_control emits float64. Casting once here halves the bytes
+    moved through vec env IPC and avoids an implicit per-step cast inside
+    the policy feed.
+    """
+
+    def __init__(self, env):
+        """Constructor
+
+        Args:
+            env (gym.Env): The environment we are wrapping. Must have a Box
+                observation space (e.g. a flattened Jitterbug env)
+        """
+        super().__init__(env)
+        space = env.observation_space
+        self.observation_space = gym.spaces.Box(
+            low=space.low.astype(np.float32),
+            high=space.high.astype(np.float32),
+            dtype=np.float32
+        )
+
+    def observation(self, observation):
+        return np.asarray(observation, dtype=np.float32)
+
+
+class SingleKeyDictWrapper(gym.ObservationWrapper):
+    """Selects a single key out of a Dict observation space
+
+    gym's FlattenDictWrapper concatenates (allocating a fresh flat array)
+    on every step even when only one key is selected. The flat-observation
+    Jitterbug env keeps its whole observation under one key, so this
+    wrapper just hands back that value, fusing the selection with the
+    float32 cast in a single np.asarray call.
+    """
+
+    def __init__(self, env, key="observations"):
+        """Constructor
+
+        Args:
+            env (gym.Env): The environment we are wrapping. Must have a
+                Dict observation space
+
+            key (str): The observation key to select
+        """
+        super().__init__(env)
+        self._key = key
+        space = env.observation_space.spaces[key]
+        self.observation_space = gym.spaces.Box(
+            low=np.asarray(space.low, dtype=np.float32),
+            high=np.asarray(space.high, dtype=np.float32),
+            dtype=np.float32
+        )
+
+    def observation(self, observation):
+        return np.asarray(observation[self._key], dtype=np.float32)
+
+
 class JitterbugGymEnv(dm2gym.DMControlEnv):
     """A renderer with customized settings for the Jitterbug domain"""
 
@@ -1,1043 +1,1451 @@
-"""A Jitterbug dm_control Reinforcement Learning domain
-
-Copyright 2018 The authors
-
-Permission is hereby granted, free of charge, to any person obtaining a copy
-of this software and associated documentation files (the "Software"), to deal
-in the Software without restriction, including without limitation the rights
-to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-copies of the Software, and to permit persons to whom the Software is
-furnished to do so, subject to the following conditions:
-
-The above copyright notice and this permission notice shall be included in all
-copies or substantial portions of the Software.
-
-THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
-AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
-LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
-OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
-SOFTWARE.
-"""
-
-from __future__ import absolute_import
-from __future__ import division
-from __future__ import print_function
-
-import os
-import sys
-import inspect
-import collections
-
-# Uncomment to disable GPU training in tensorflow (must be before keras imports)
-os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
-
-import numpy as np
-import tensorflow as tf
-
-from dm_control import mujoco
-from dm_control.rl import control
-from dm_control.suite import base
-from dm_control.suite import common
-from dm_control.utils import rewards
-from dm_control.utils import containers
-from dm_control.utils import io as resources
-from dm_control.mujoco.wrapper.mjbindings import mjlib
-import torch
-import torch.optim as opt
-
-import denoising_autoencoder
-import VAE
-# Load the suite so we can add to it
-SUITE = containers.TaggedTasks()
-
-# Task constants
-DEFAULT_TIME_LIMIT = 10
-DEFAULT_CONTROL_TIMESTEP = 0.01
-TARGET_SPEED = 0.1
-
-
-def get_model_and_assets():
-    """Returns a tuple containing the model XML string and a dict of assets"""
-    return (
-        resources.GetResource(os.path.join(
-            os.path.dirname(os.path.abspath(__file__)),
-            "jitterbug.xml"
-        )),
-        common.ASSETS
-    )
-
-
-@SUITE.add("benchmarking", "easy")
-def move_from_origin(
-        time_limit=DEFAULT_TIME_LIMIT,
-        control_timestep=DEFAULT_CONTROL_TIMESTEP,
-        random=None,
-        environment_kwargs=None,
-        **kwargs
-):
-    """Move the Jitterbug away from the origin"""
-    physics = Physics.from_xml_string(*get_model_and_assets())
-    task = Jitterbug(random=random, task="move_from_origin", **kwargs)
-    environment_kwargs = environment_kwargs or {}
-    return control.Environment(
-        physics,
-        task,
-        time_limit=time_limit,
-        control_timestep=control_timestep,
-        **environment_kwargs
-    )
-
-
-@SUITE.add("benchmarking", "easy")
-def face_direction(
-        time_limit=DEFAULT_TIME_LIMIT,
-        control_timestep=DEFAULT_CONTROL_TIMESTEP,
-        random=None,
-        environment_kwargs=None,
-        **kwargs
-):
-    """Move the Jitterbug to face a certain yaw angle"""
-    physics = Physics.from_xml_string(*get_model_and_assets())
-    task = Jitterbug(random=random, task="face_direction", **kwargs)
-    environment_kwargs = environment_kwargs or {}
-    return control.Environment(
-        physics,
-        task,
-        time_limit=time_limit,
-        control_timestep=control_timestep,
-        **environment_kwargs
-    )
-
-
-@SUITE.add("benchmarking", "easy")
-def move_in_direction(
-        time_limit=DEFAULT_TIME_LIMIT,
-        control_timestep=DEFAULT_CONTROL_TIMESTEP,
-        random=None,
-        environment_kwargs=None,
-        **kwargs
-):
-    """Move the Jitterbug in a certain direction"""
-    physics = Physics.from_xml_string(*get_model_and_assets())
-    task = Jitterbug(random=random, task="move_in_direction", **kwargs)
-    environment_kwargs = environment_kwargs or {}
-    return control.Environment(
-        physics,
-        task,
-        time_limit=time_limit,
-        control_timestep=control_timestep,
-        **environment_kwargs
-    )
-
-
-@SUITE.add("benchmarking", "hard")
-def move_to_position(
-        time_limit=DEFAULT_TIME_LIMIT,
-        control_timestep=DEFAULT_CONTROL_TIMESTEP,
-        random=None,
-        environment_kwargs=None,
-        **kwargs
-):
-    """Move the Jitterbug to a certain XYZ position"""
-    physics = Physics.from_xml_string(*get_model_and_assets())
-    task = Jitterbug(random=random, task="move_to_position", **kwargs)
-    environment_kwargs = environment_kwargs or {}
-    return control.Environment(
-        physics,
-        task,
-        time_limit=time_limit,
-        control_timestep=control_timestep,
-        **environment_kwargs
-    )
-
-
-@SUITE.add("benchmarking", "hard")
-def move_to_pose(
-        time_limit=DEFAULT_TIME_LIMIT,
-        control_timestep=DEFAULT_CONTROL_TIMESTEP,
-        random=None,
-        environment_kwargs=None,
-        **kwargs
-):
-    """Move the Jitterbug to a certain XYZRPY pose"""
-    physics = Physics.from_xml_string(*get_model_and_assets())
-    task = Jitterbug(random=random, task="move_to_pose", **kwargs)
-    environment_kwargs = environment_kwargs or {}
-    return control.Environment(
-        physics,
-        task,
-        time_limit=time_limit,
-        control_timestep=control_timestep,
-        **environment_kwargs
-    )
-
-
-class Physics(mujoco.Physics):
-    """Physics simulation with additional features"""
-
-    def jitterbug_position(self):
-        """Get the full jitterbug pose vector"""
-        return self.named.data.qpos["root"]
-
-    def jitterbug_position_xyz(self):
-        """Get the XYZ position of the Jitterbug"""
-        return self.jitterbug_position()[:3]
-
-    def jitterbug_position_quat(self):
-        """Get the orientation of the Jitterbug"""
-        return self.jitterbug_position()[3:]
-
-    def jitterbug_direction_yaw(self):
-        """Get the yaw angle of the Jitterbug in radians
-
-        Returns:
-            (float): Yaw angle of the Jitterbug in radians on the range
-                [-pi, pi]
-        """
-        mat = np.zeros(9)
-        mjlib.mju_quat2Mat(mat, self.jitterbug_position_quat())
-        mat = mat.reshape((3, 3))
-        yaw = np.arctan2(mat[1, 0], mat[0, 0])
-
-        # Jitterbug model faces the -Y direction, so we rotate 90deg CW to
-        # align its face with the +X axis
-        yaw -= np.pi / 2
-
-        return yaw
-
-    def jitterbug_velocity(self):
-        """Get the full jitterbug velocity vector"""
-        return self.named.data.qvel["root"]
-
-    def jitterbug_velocity_xyz(self):
-        """Get the XYZ velocity of the Jitterbug"""
-        return self.jitterbug_velocity()[:3]
-
-    def jitterbug_velocity_rpy(self):
-        """Get the angular velocity of the Jitterbug"""
-        return self.jitterbug_velocity()[3:]
-
-    def motor_position(self):
-        """Get the motor angular position
-
-        NB: This function artificially rotates the motor frame so that 0deg is
-        facing forwards on the Jitterbug
-
-        Returns:
-            (float): The motor position in radians on the range [-pi, pi]
-        """
-
-        # Offset motor so 0deg is facing forwards on the jitterbug
-        angle = self.named.data.qpos["jointMass"] + np.pi / 2
-
-        while angle > np.pi:
-            angle -= 2 * np.pi
-        while angle <= -np.pi:
-            angle += 2 * np.pi
-        return angle
-
-    def motor_velocity(self):
-        """Get the motor angular velocity"""
-        return self.named.data.qvel["jointMass"]
-
-    def target_position(self):
-        """Get the full target pose vector"""
-        return np.concatenate((
-            self.target_position_xyz(),
-            self.target_position_quat()#data gathering while learning the task move_in_direction with ddpg
-        ),
-            axis=0
-        )
-
-    def target_position_xyz(self):
-        """Get the XYZ position of the target"""
-        return self.named.data.geom_xpos["target"]
-
-    def target_position_quat(self):
-        """Get the orientation of the target"""
-        return self.named.data.xquat["target"]
-
-    def target_direction_yaw(self):
-        """Get the yaw angle of the target in radians
-
-        Returns:
-            (float): Yaw angle of the target in radians on the range
-                [-pi, pi]
-        """
-        mat = np.zeros(9)
-        mjlib.mju_quat2Mat(mat, self.target_position_quat())
-        mat = mat.reshape((3, 3))
-        yaw = np.arctan2(mat[1, 0], mat[0, 0])
-        return yaw
-
-    def target_position_in_jitterbug_frame(self):
-        """Find XYZ position of the target in the Jitterbug frame
-
-        NB: +X in Jitterbug frame is to the LHS, +Y in Jitterbug frame is
-        backwards
-        """
-
-        # Find relative target position
-        target_pos = self.target_position_xyz() - self.jitterbug_position_xyz()
-
-        # Get the Jitterbug frame rotation matrix
-        jitterbug_rot_mat = np.zeros(9)
-        mjlib.mju_quat2Mat(jitterbug_rot_mat, self.jitterbug_position_quat())
-
-        # Apply inverse transform to put target in JB frame
-        return np.linalg.inv(jitterbug_rot_mat.reshape((3, 3))) @ target_pos
-
-    def jitterbug_velocity_in_target_frame(self):
-        """Find the XYZ velocity of the Jitterbug in the target frame"""
-
-        # Get the Jitterbug global frame velocity
-        jitterbug_vel = self.named.data.sensordata['jitterbug_framelinvel']
-
-        # Get the target frame rotation matrix
-        target_rot_mat = np.zeros(9)
-        mjlib.mju_quat2Mat(target_rot_mat, self.target_position_quat())
-
-        # Apply inverse rotation to put velocity in target frame
-        return np.linalg.inv(target_rot_mat.reshape((3, 3))) @ jitterbug_vel
-
-    def angle_jitterbug_to_target(self):
-        """Gets the relative yaw angle from Jitterbug heading to the target
-
-        Returns:
-            (float): The relative angle in radians from the target to the
-                Jitterbug on the range [-pi, pi]
-        """
-        angle = self.target_direction_yaw() - self.jitterbug_direction_yaw()
-        while angle > np.pi:
-            angle -= 2 * np.pi
-        while angle <= -np.pi:
-            angle += 2 * np.pi
-        return np.array([angle])
-
-
-class Jitterbug(base.Task):
-    """A jitterbug `Task`"""
-
-    # Approximate Min, Max ranges for observation dimensions
-    _NORM_ALL = np.array([
-        # Position
-        [-2.0,    2.0],                         # X
-        [-2.0,    2.0],                         # Y
-        [ 0.0,    0.1],                         # Z
-        [-1.0,    1.0],                         # Qx
-        [-1.0,    1.0],                         # Qy
-        [-1.0,    1.0],                         # Qz
-        [-1.0,    1.0],                         # Qw
-
-        # Velocity
-        [-1.0,    1.0],                         # Vx
-        [-1.0,    1.0],                         # Vy
-        [-1.0,    1.0],                         # Vz
-        [-35.0,   35.0],                        # Vr
-        [-35.0,   35.0],                        # Vp
-        [-35.0,   35.0],                        # Vy
-
-        # Motor position
-        [-np.pi, np.pi],                        # motor angle
-
-        # Motor velocity
-        [-180.0, 180.0],                        # motor velocity
-    ])
-
-    # Approximate Min, max ranges for observation dimensions specific to tasks
-    _NORM_TASKS = dict(
-        move_from_origin=np.array([]),                    # No extra dimensions
-        face_direction=np.array([
-            [-np.pi, np.pi]                     # Relative Yaw angle
-        ]),
-        move_in_direction=np.array([
-            [-np.pi, np.pi],                    # Relative Yaw angle
-            [-1.0, 1.0],                        # Relative Vx
-            [-1.0, 1.0],                        # Relative Vy
-            [-1.0, 1.0]                         # Relative Vz
-        ]),
-        move_to_position=np.array([
-            [-3.0, 3.0],                        # Relative X
-            [-3.0, 3.0],                        # Relative Y
-            [-0.1, 0.1]                         # Relative Z
-        ]),
-        move_to_pose=np.array([
-            [-3.0, 3.0],                        # Relative X
-            [-3.0, 3.0],                        # Relative Y
-            [-0.1, 0.1],                        # Relative Z
-            [-np.pi, np.pi]                     # Relative Yaw Angle
-        ])
-    )
-
-    def __init__(
-            self,
-            random=None,
-            task="move_from_origin",
-            random_pose=True,
-            norm_obs=False
-    ):
-        """Initialize an instance of the `Jitterbug` domain
-
-        Args:
-            random (numpy.random.RandomState): Options are;
-                - numpy.random.RandomState instance
-                - An integer seed for creating a new `RandomState`
-                - None to select a seed automatically (default)
-            task (str): Specifies which task to configure. Options are;
-                - move_from_origin
-                - face_direction
-                - move_in_direction
-                - move_to_position
-                - move_to_pose
-            random_pose (bool): If true, initialize the Jitterbug with a random
-                pose to break symmetries
-            norm_obs (bool): If true, observations will be approximately normalized
-                to the range (-1, 1)
-        """
-
-        self.feature_names = [
-            'root_x',
-            'root_y',
-           'root_z',
-            'root_qx',
-            'root_qy',
-           ' root_qz',
-            'root_qw',
-            'root_vx',
-            'root_vy',
-            'root_vz',
-            'root_roll',
-            'root_pitch',
-            'root_yaw',
-            'motor_position',
-            'motor_velocity',
-            'angle_to_target'
-                    ]
-
-        # Reflect to get task names from the current module
-        self.task_names = [
-            obj[0]
-            for obj in inspect.getmembers(sys.modules[__name__])
-            if inspect.isfunction(obj[1]) and obj[0] in SUITE._tasks
-        ]
-        assert task in self.task_names, \
-            "Invalid task {}, options are {}".format(task, self.task_names)
-
-        self.task = task
-        self.random_pose = random_pose
-        self.norm_obs = norm_obs
-        super(Jitterbug, self).__init__(random=random)
-
-        #self.pickleFile = open("observations.pkl", "wb")
-        self.principalVectors = np.array([[0.0049, 0.0171, -0.0001, -0.0001, 0.0003, 0, 0, 0],
-                                          [0.0242, -0.0042, -0.0002, 0.0001, 0.0001, 0, 0, 0],
-                                          [-0.0002, -0.0001, 0.0003, 0, 0, 0, 0, 0],
-                                          [0.1224, 0.9907, 0.0519, -0.0072, 0.0094, -0.0001, 0.0001, 0.0001],
-                                          [-0.0019, 0.0201, 0.0014, -0.0006, 0.0003, 0, -0.0002, 0],
-                                          [0.0224, -0.0022, -0.0009, 0, -0.0001, -0.0003, 0, 0],
-                                          [0.9918, -0.1215, -0.0179, 0.0052, 0.0022, 0, -0.0001, -0.0002],
-                                          [0.0014, 0.0043, 0.0001, 0.0003, 0.0001, 0.0002, 0.0001, 0],
-                                          [0.0066, -0.0011, 0.0001, -0.0002, 0, 0.0001, -0.0001, 0],
-                                          [0.0001, 0, -0.0002, 0.0001, -0.0001, 0.0012, 0, 0],
-                                          [-0.0002, 0, 0.0004, 0.0284, 0.0096, -0.9995, -0.0035, -0.0003],
-                                          [-0.0003, 0.0004, -0.0014, 0.0766, 0.0141, -0.0011, 0.997, 0.0007],
-                                          [0.0038, 0.0067, 0.0441, 0, -0.9988, -0.0096, 0.0142, -0.0046],
-                                          [0.0043, -0.0079, 0.0022, -0.9966, 0.0014, -0.0286, 0.0765, 0],
-                                          [0.0002, -0.0004, 0.0057, -0.0001, -0.0044, -0.0003, -0.0007, 1],
-                                          [-0.0113, 0.054, -0.9975, -0.0027, -0.0438, -0.0009, -0.0006, 0.0055]])
-
-        self.principalVectors4dim = np.array([[0.0003, 0, 0, 0],
-                                              [0.0001, 0, 0, 0],
-                                              [0, 0, 0, 0],
-                                              [0.0094, -0.0001, 0.0001, 0.0001],
-                                              [0.0003, 0, -0.0002, 0],
-                                              [-0.0001, -0.0003, 0, 0],
-                                              [0.0022, 0, -0.0001, -0.0002],
-                                              [0.0001, 0.0002, 0.0001, 0],
-                                              [0, 0.0001, -0.0001, 0],
-                                              [-0.0001, 0.0012, 0, 0],
-                                              [0.0096, -0.9995, -0.0035, -0.0003],
-                                              [0.0141, -0.0011, 0.997, 0.0007],
-                                              [-0.9988, -0.0096, 0.0142, -0.0046],
-                                              [0.0014, -0.0286, 0.0765, 0],
-                                              [-0.0044, -0.0003, -0.0007, 1],
-                                              [-0.0438, -0.0009, -0.0006, 0.0055]])
-
-        self.use_autoencoder = False
-        self.use_several_autoencoders = False
-        self.use_denoising_autoencoder = False
-        self.use_VAE = True
-        self.train_autoencoder = False
-        self.use_denoising_autoencoder15 = False
-        self.use_autoencoder15 = False
-        self.use_autoencoder13 = False
-
-        self.normalize01 = False
-
-        if self.use_autoencoder:
-            g = tf.Graph()
-            with g.as_default():
-                sess = tf.Session(graph=g)
-
-                self.session = sess
-                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=16,
-                                                                     lr=0.0005,
-                                                                     sess=self.session
-                                                                     )
-                i=32
-                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
-                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
-
-        if self.use_denoising_autoencoder:
-            g = tf.Graph()
-            with g.as_default():
-                sess = tf.Session(graph=g)
-
-                self.session = sess
-                self.jitterbug_autoencoder = denoising_autoencoder.Autoencoder(feature_dimension=19,
-                                                                     lr=0.0005,
-                                                                     sess=self.session
-                                                                     )
-                i=46
-                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
-                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
-
-        if self.use_VAE:
-            device = torch.device(
-                "cuda" if torch.cuda.is_available() and use_gpu
-                else "cpu"
-            )
-            self.jitterbug_autoencoder = VAE.VAE(data_size=19, latent_size=15).to(device)
-            optimizer = opt.Adam(self.jitterbug_autoencoder.parameters(), lr=1e-3)
-            path = "./VAE.pt"
-            self.jitterbug_autoencoder.load_autoencoder(path)
-            print("VAE loaded from "+path)
-
-        if self.use_denoising_autoencoder15:
-            g = tf.Graph()
-            with g.as_default():
-                sess = tf.Session(graph=g)
-
-                self.session = sess
-                self.jitterbug_autoencoder = denoising_autoencoder.Autoencoder(feature_dimension=15,
-                                                                     lr=0.0005,
-                                                                     sess=self.session,
-                                                                     )
-                i=28
-                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
-                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
-
-        if self.use_autoencoder15:
-            g = tf.Graph()
-            with g.as_default():
-                sess = tf.Session(graph=g)
-
-                self.session = sess
-                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=15,
-                                                                     lr=0.0005,
-                                                                     sess=self.session
-                                                                     )
-                i=29
-                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
-                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
-
-        if self.use_autoencoder13:
-            g = tf.Graph()
-            with g.as_default():
-                sess = tf.Session(graph=g)
-
-                self.session = sess
-                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=13,
-                                                                     lr=0.0005,
-                                                                     sess=self.session
-                                                                     )
-                i=30
-                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
-                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
-
-
-        if self.train_autoencoder:
-            g = tf.Graph()
-            with g.as_default():
-                sess = tf.Session(graph=g)
-
-                self.session = sess
-                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=16,
-                                                                            lr=0.001,
-                                                                            sess=self.session
-                                                                            )
-
-        if self.use_several_autoencoders:
-            self.index_list = [11,15,16,17,18]
-            self.num_autoencoders = len(self.index_list)
-            self.autoencoder_list = []
-            self.session_list = []
-            for i in self.index_list:
-                #Generate a session for each autoencoder
-                g_i = tf.Graph()
-                with g_i.as_default():
-                    session_i = tf.Session(graph=g_i)
-                    self.session_list.append(session_i)
-                    jitterbug_autoencoder_i = autoencoder.Autoencoder(feature_dimension=16,
-                                                                      lr=0.0005,
-                                                                      sess=session_i
-                                                                      )
-                    print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
-                    jitterbug_autoencoder_i.load_autoencoder(f"./autoencoder_model{i}.ckpt")
-                    self.autoencoder_list.append(jitterbug_autoencoder_i)
-
-
-        self.extremum = np.array([[float('Inf'),-float('Inf')]]*16)
-        self.N_features =len(self.extremum)
-
-
-        self.counter = 0
-        self.observation_buffer = []
-        self.batch_size = 1000
-        self.buffer_size = int(1e4)
-
-    def initialize_episode(self, physics):
-        """Sets the state of the environment at the start of each episode
-        """
-
-        # Use reset context to ensure changes are applied immediately
-        with physics.reset_context():
-
-            # Configure target based on task
-            angle = self.random.uniform(0, 2 * np.pi)
-            radius = self.random.uniform(.05, 0.2)
-            yaw = np.random.uniform(0, 2 * np.pi)
-
-            if self.task == "move_from_origin":
-
-                # Hide the target orientation as it is not needed for this task
-                physics.named.model.geom_rgba["targetPointer", 3] = 0
-
-            elif self.task == "face_direction":
-
-                # Randomize target orientation
-                physics.named.model.body_quat["target"] = np.array([
-                    np.cos(yaw / 2), 0, 0, 1 * np.sin(yaw / 2)
-                ])
-
-            elif self.task == "move_in_direction":
-
-                # Randomize target orientation
-                physics.named.model.body_quat["target"] = np.array([
-                    np.cos(yaw / 2), 0, 0, 1 * np.sin(yaw / 2)
-                ])
-
-            elif self.task == "move_to_position":
-
-                # Hide the target orientation indicator as it is not needed
-                physics.named.model.geom_rgba["targetPointer", 3] = 0
-
-                # Randomize target position
-                physics.named.model.body_pos["target", "x"] = radius * np.cos(angle)
-                physics.named.model.body_pos["target", "y"] = radius * np.sin(angle)
-
-            elif self.task == "move_to_pose":
-
-                # Randomize full target pose
-                physics.named.model.body_pos["target", "x"] = radius * np.cos(angle)
-                physics.named.model.body_pos["target", "y"] = radius * np.sin(angle)
-                physics.named.model.body_quat["target"] = np.array([
-                    np.cos(yaw / 2), 0, 0, 1 * np.sin(yaw / 2)
-                ])
-
-            else:
-                raise ValueError("Invalid task {}".format(self.task))
-
-            if self.random_pose:
-                # Randomize Jitterbug orientation to break symmetries
-                rotation_angle = np.random.random() * 2 * np.pi
-                rotation_axis = np.concatenate((
-                    np.random.random(size=2) * 0.05 - 0.025,
-                    (1.0,)
-                ))
-                rotation_axis /= np.linalg.norm(rotation_axis)
-                physics.named.data.qpos["root"][3:] = np.concatenate((
-                    (np.cos(rotation_angle / 2),),
-                    np.sin(rotation_angle / 2) * rotation_axis
-                ))
-
-        super(Jitterbug, self).initialize_episode(physics)
-
-    @staticmethod
-    def _norm(v, min, max):
-        """Normalize a vector to the range (-1.0, 1.0)"""
-        return (v - min) / (max - min) * 2.0 - 1.0
-
-    def get_observation(self, physics):
-        """Returns an observation of the state and the target position
-        """
-        obs = collections.OrderedDict()
-        obs['position'] = Jitterbug._norm(
-            physics.jitterbug_position(),
-            Jitterbug._NORM_ALL[0:7, 0],
-            Jitterbug._NORM_ALL[0:7, 1]
-        )
-        obs['velocity'] = Jitterbug._norm(
-            physics.jitterbug_velocity(),
-            Jitterbug._NORM_ALL[7:13, 0],
-            Jitterbug._NORM_ALL[7:13, 1]
-        )
-
-        obs['motor_position'] = Jitterbug._norm(
-            physics.motor_position(),
-            Jitterbug._NORM_ALL[13, 0],
-            Jitterbug._NORM_ALL[13, 1]
-        )
-
-        obs['motor_velocity'] = Jitterbug._norm(
-            physics.motor_velocity(),
-            Jitterbug._NORM_ALL[14, 0],
-            Jitterbug._NORM_ALL[14, 1]
-        )
-
-        if self.task == "move_from_origin":
-
-            # Jitterbug position is a sufficient observation for this task
-            pass
-
-        elif self.task == "face_direction":
-
-            # Store the relative target yaw angle
-            obs['angle_to_target'] = Jitterbug._norm(
-                physics.angle_jitterbug_to_target(),
-                Jitterbug._NORM_TASKS['face_direction'][0, 0],
-                Jitterbug._NORM_TASKS['face_direction'][0, 1]
-            )
-
-        elif self.task == "move_in_direction":
-
-            # Store the relative target yaw angle
-            obs['angle_to_target'] = Jitterbug._norm(
-                physics.angle_jitterbug_to_target(),
-                Jitterbug._NORM_TASKS['move_in_direction'][0, 0],
-                Jitterbug._NORM_TASKS['move_in_direction'][0, 1]
-            )
-
-            # Store the speed in the target frame
-            obs['speed_in_target_frame'] = Jitterbug._norm(
-                physics.jitterbug_velocity_in_target_frame(),
-                Jitterbug._NORM_TASKS['move_in_direction'][1:, 0],
-                Jitterbug._NORM_TASKS['move_in_direction'][1:, 1]
-            )
-
-        elif self.task == "move_to_position":
-
-            # Store the relative target XYZ position in JB frame
-            obs['target_in_jitterbug_frame'] = Jitterbug._norm(
-                physics.target_position_in_jitterbug_frame(),
-                Jitterbug._NORM_TASKS['move_to_position'][:, 0],
-                Jitterbug._NORM_TASKS['move_to_position'][:, 1]
-            )
-
-        elif self.task == "move_to_pose":
-
-            # Store the relative target XYZ position in JB frame
-            obs['target_in_jitterbug_frame'] = Jitterbug._norm(
-                physics.target_position_in_jitterbug_frame(),
-                Jitterbug._NORM_TASKS['move_to_pose'][0:3, 0],
-                Jitterbug._NORM_TASKS['move_to_pose'][0:3, 1]
-            )
-
-            # Store the relative target yaw angle
-            obs['angle_to_target'] = Jitterbug._norm(
-                physics.angle_jitterbug_to_target(),
-                Jitterbug._NORM_TASKS['move_to_pose'][3, 0],
-                Jitterbug._NORM_TASKS['move_to_pose'][3, 1]
-            )
-
-        else:
-            raise ValueError("Invalid task {}".format(self.task))
-
-        self.counter += 1
-
-        if self.use_autoencoder or self.use_several_autoencoders or self.use_denoising_autoencoder or self.train_autoencoder or self.use_denoising_autoencoder15 or self.use_autoencoder15 or self.use_autoencoder13 or self.use_VAE:
-            obs = self.encode_obs(obs)
-
-        return obs
-
-    def obsdict2vec(self, obs):
-        """Convert an observation dictionary to vector
-
-        Args:
-            obs (dict): Observation dictionary
-
-        Returns:
-            (numpy array): Observation vector (size depends on task)
-            (list): Observation vector column names
-        """
-
-        # All tasks start with 15 dimensions
-        obs_vec = np.concatenate((
-            obs['position'],            # 3 dims (X, Y, Z, Qx, Qy, Qz, Qw)
-            obs['velocity'],            # 6 dims (Vx, Vy, Vz, r, p, y)
-            obs['motor_position'],      # 1 dim (angle)
-            obs['motor_velocity'],      # 1 dim (angular vel)
-        ))
-
-        columns = [
-            "X", "Y", "Z", "QuatX", "QuatY", "QuatZ", "QuatW",
-            "VelX", "VelY", "VelZ", "VelRoll", "VelPitch", "VelYaw",
-            "MotorYaw",
-            "MotorVelYaw"
-        ]
-
-        # The task definition adds 0 to 4 dimensions
-        if self.task == "move_from_origin":
-            # Jitterbug position is a sufficient observation for this task
-            pass
-
-        elif self.task == "face_direction":
-
-            obs_vec = np.concatenate((
-                obs_vec,
-                obs['angle_to_target'],                  # 1 dim (relative yaw angle)
-            ))
-            columns.append("TargetYaw")
-
-        elif self.task == "move_in_direction":
-
-            obs_vec = np.concatenate((
-                obs_vec,
-                obs['angle_to_target'],                  # 1 dim (relative yaw angle)
-                obs['speed_in_target_frame']             # 3 dims (relative Vx, Vy, Vz)
-            ))
-            columns.append("TargetYaw")
-            columns.append("TargetVelX")
-            columns.append("TargetVelY")
-            columns.append("TargetVelZ")
-
-        elif self.task == "move_to_position":
-
-            obs_vec = np.concatenate((
-                obs_vec,
-                obs['target_in_jitterbug_frame'],       # 3 dims (relative X, Y, Z)
-            ))
-            columns.append("TargetX")
-            columns.append("TargetY")
-            columns.append("TargetZ")
-
-        elif self.task == "move_to_pose":
-
-            obs_vec = np.concatenate((
-                obs_vec,
-                obs['target_in_jitterbug_frame'],       # 3 dims (relative X, Y, Z)
-                obs['angle_to_target']                  # 1 dim (relative yaw angle)
-            ))
-            columns.append("TargetX")
-            columns.append("TargetY")
-            columns.append("TargetZ")
-            columns.append("TargetYaw")
-
-        return obs_vec, columns
-
-    def heading_reward(self, physics):
-        """Compute a reward for facing a certain direction
-
-        Returns:
-            (float): Angular reward on [0, 1]
-        """
-        return rewards.tolerance(
-            physics.angle_jitterbug_to_target()[0],
-            bounds=(0, 0),
-            margin=np.pi / 2,
-            value_at_margin=0,
-            sigmoid='cosine'
-        )
-
-    def velocity_reward(self, physics):
-        """Compute a reward for moving in a certain direction
-
-        Returns:
-            (float): Velocity reward on [0, 1]
-        """
-        return rewards.tolerance(
-            physics.jitterbug_velocity_in_target_frame()[0],
-            bounds=(TARGET_SPEED, float('inf')),
-            margin=TARGET_SPEED,
-            value_at_margin=0,
-            sigmoid='linear'
-        )
-
-    def position_reward(self, physics):
-        """Compute a reward for moving to a certain position
-
-        Returns:
-            (float): Position reward on [0, 1]
-        """
-        return rewards.tolerance(
-            np.linalg.norm(
-                physics.target_position_in_jitterbug_frame()
-            ),
-            bounds=(0, 0),
-            margin=0.05
-        )
-
-    def upright_reward(self, physics):
-        """Reward Jitterbug for remaining upright"""
-        return rewards.tolerance(
-            # Dot product of the Jitterbug Z axis with the global Z
-            physics.named.data.xmat['jitterbug', 'zz'],
-            bounds=(1, 1),
-            margin=0.5
-        )
-
-    def get_reward(self, physics):
-
-        r = 0
-
-        if self.task == "move_from_origin":
-
-            r = (1 - self.position_reward(physics))
-
-        elif self.task == "face_direction":
-
-            r = self.heading_reward(physics)
-
-        elif self.task == "move_in_direction":
-
-            r = self.velocity_reward(physics)
-
-        elif self.task == "move_to_position":
-
-            r = self.position_reward(physics)
-
-        elif self.task == "move_to_pose":
-
-            # Use multiplicative reward
-            r = (
-                    self.position_reward(physics) *
-                    self.heading_reward(physics)
-            )
-
-        else:
-            raise ValueError("Invalid task {}".format(self.task))
-
-        # Reward Jitterbug for staying upright
-        r *= self.upright_reward(physics)
-        # print(r)
-        return r
-
-    def encode_obs(self, obs):
-        obs_line = []
-        for key in obs:
-            obs_line.append(obs[key])
-        obsArray = np.concatenate(obs_line)
-        if self.train_autoencoder:
-            if self.normalize01:
-                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs01(obsArray))]
-            else:
-                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs(obsArray))]
-            self.observation_buffer.insert(0, norm_obs[0]) #Add observation to buffer
-
-            while len(self.observation_buffer)>self.buffer_size:
-                self.observation_buffer.pop() #Remove the oldest observations from the buffer
-
-            encoded_obs = self.jitterbug_autoencoder.encode(norm_obs)
-            encoded_obs_dict = {'observations': np.array(encoded_obs)}
-            if self.counter % self.batch_size == 0:
-                self.update_autoencoder()
-
-        if self.use_autoencoder or self.use_denoising_autoencoder:
-            encoded_obs = self.jitterbug_autoencoder.encode([obsArray])
-            encoded_obs_dict = {'observations': np.array(encoded_obs)}
-
-        if self.use_VAE:
-            encoded_obs = self.jitterbug_autoencoder.encode(torch.Tensor(obsArray))
-            encoded_obs_dict = {'observations': np.array(encoded_obs)}
-
-        if self.use_denoising_autoencoder15 or self.use_autoencoder15:
-            if self.normalize01:
-                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs01(obsArray))]
-            else:
-                norm_obs = np.array(self.jitterbug_autoencoder.normalize_obs(obsArray))
-            #print("###############")
-            #print(norm_obs)
-            angle_to_target_norm = norm_obs[15]
-            norm_obs_15 = [norm_obs[:15]]
-            encoded_obs_15 = self.jitterbug_autoencoder.encode(norm_obs_15)
-            encoded_obs = np.concatenate((encoded_obs_15[0],[angle_to_target_norm]))
-            #print(encoded_obs)
-            encoded_obs_dict = {'observations': np.array(encoded_obs)}
-
-        if self.use_autoencoder13:
-            if self.normalize01:
-                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs01(obsArray))]
-            else:
-                norm_obs = np.array(self.jitterbug_autoencoder.normalize_obs(obsArray))
-            #print("###############")
-            #print(norm_obs)
-            unchanged_features_norm = norm_obs[13:]
-            norm_obs_13 = [norm_obs[:13]]
-            encoded_obs_13 = self.jitterbug_autoencoder.encode(norm_obs_13)
-            encoded_obs = np.concatenate((encoded_obs_13[0], unchanged_features_norm))
-            #print(encoded_obs)
-            encoded_obs_dict = {'observations': np.array(encoded_obs)}
-
-        elif self.use_several_autoencoders:
-            encoded_list = []
-            norm_obs = [np.array(self.autoencoder_list[0].normalize_obs(obsArray))]
-            #print("###############")
-            #print(norm_obs)
-            for i in range(self.num_autoencoders):
-                encoded_list.append(np.array(self.autoencoder_list[i].encode(norm_obs)))
-            encoded_obs = sum(encoded_list)/self.num_autoencoders
-            #print(encoded_obs)
-            encoded_obs_dict = {'observations': encoded_obs}
-        return encoded_obs_dict
-
-    def update_autoencoder(self):
-        self.jitterbug_autoencoder.train_autoencoder(training_data=self.observation_buffer,
-                                                     num_epoch=1,
-                                                     batch_size=self.batch_size,
-                                                     )
-        print("Autoencoder updated")
-
-    def PCA(self, obs):
-        obsArray = np.concatenate(
-            (obs['position'], obs['velocity'], obs['motor_position'], obs['motor_velocity'], obs['angle_to_target']))
-        return {'observations': np.dot(obsArray, self.principalVectors4dim)}
-
-
-def demo():
-    """Demonstrate the Jitterbug domain"""
-
-    # Get some imports
-    from dm_control import suite
-    from dm_control import viewer
-
-    # Add the jitterbug tasks to the suite
-    import jitterbug_dmc
-
-    # Load the Jitterbug domain
-    env = suite.load(
-        domain_name="jitterbug",
-        task_name="move_from_origin",
-        visualize_reward=True,
-        task_kwargs=dict(
-            #time_limit=float("inf")
-            norm_obs=True
-        )
-    )
-
-    def policy(ts):
-        """Constant policy"""
-        print(ts.observation)
-        return 0.8
-
-    # Dance, jitterbug, dance!
-    viewer.launch(
-        env,
-        policy=policy,
-        title="Jitterbug Demo"
-    )
-
-
-if __name__ == '__main__':
-    demo()
+"""A Jitterbug dm_control Reinforcement Learning domain
+
+Copyright 2018 The authors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import math
+import functools
+import collections
+
+# Uncomment to disable GPU training in tensorflow (must be before keras imports)
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+import numpy as np
+import tensorflow as tf
+
+from dm_control import mujoco
+from dm_control.rl import control
+from dm_control.suite import base
+from dm_control.suite import common
+from dm_control.utils import rewards
+from dm_control.utils import containers
+from dm_control.utils import io as resources
+from dm_control.mujoco.wrapper.mjbindings import mjlib
+import torch
+import torch.optim as opt
+
+import denoising_autoencoder
+import VAE
+
+try:
+    # Optional: JIT-compile the per-step observation normalization. For a
+    # fast env like the Jitterbug the interpreter overhead of this per-step
+    # arithmetic is measurable
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit when numba is not installed"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Load the suite so we can add to it
+SUITE = containers.TaggedTasks()
+
+# Task constants
+DEFAULT_TIME_LIMIT = 10
+DEFAULT_CONTROL_TIMESTEP = 0.01
+TARGET_SPEED = 0.1
+
+
+@njit(fastmath=True, cache=True)
+def _norm_obs(v, min, max):
+    """Normalize a vector to the range (-1.0, 1.0)"""
+    return (v - min) / (max - min) * 2.0 - 1.0
+
+
+@njit(fastmath=True, cache=True)
+def _quat_yaw(q0, q1, q2, q3):
+    """Closed-form yaw angle of a unit quaternion
+
+    The relevant rotation matrix entries are m10 = 2(q1 q2 + q0 q3) and
+    m00 = q0^2 + q1^2 - q2^2 - q3^2, so the full matrix is never built.
+    """
+    return math.atan2(
+        2.0 * (q1 * q2 + q0 * q3),
+        q0 * q0 + q1 * q1 - q2 * q2 - q3 * q3
+    )
+
+
+@njit(fastmath=True, cache=True)
+def _wrap_angle(angle):
+    """Wrap an angle onto [-pi, pi) with one branchless modulo"""
+    return (angle + math.pi) % (2.0 * math.pi) - math.pi
+
+
+# Cached (XML string, assets) tuple; see get_model_and_assets
+_MODEL_AND_ASSETS = None
+
+
+def get_model_and_assets():
+    """Returns a tuple containing the model XML string and a dict of assets
+
+    The XML is read from disk on the first call and cached, so constructing
+    many envs (e.g. one per parallel worker) costs one disk read in total.
+    """
+    global _MODEL_AND_ASSETS
+    if _MODEL_AND_ASSETS is None:
+        _MODEL_AND_ASSETS = (
+            resources.GetResource(os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "jitterbug.xml"
+            )),
+            common.ASSETS
+        )
+    return _MODEL_AND_ASSETS
+
+
+@SUITE.add("benchmarking", "easy")
+def move_from_origin(
+        time_limit=DEFAULT_TIME_LIMIT,
+        control_timestep=DEFAULT_CONTROL_TIMESTEP,
+        random=None,
+        environment_kwargs=None,
+        **kwargs
+):
+    """Move the Jitterbug away from the origin"""
+    physics = Physics.from_xml_string(*get_model_and_assets())
+    task = Jitterbug(random=random, task="move_from_origin", **kwargs)
+    environment_kwargs = environment_kwargs or {}
+    return control.Environment(
+        physics,
+        task,
+        time_limit=time_limit,
+        control_timestep=control_timestep,
+        **environment_kwargs
+    )
+
+
+@SUITE.add("benchmarking", "easy")
+def face_direction(
+        time_limit=DEFAULT_TIME_LIMIT,
+        control_timestep=DEFAULT_CONTROL_TIMESTEP,
+        random=None,
+        environment_kwargs=None,
+        **kwargs
+):
+    """Move the Jitterbug to face a certain yaw angle"""
+    physics = Physics.from_xml_string(*get_model_and_assets())
+    task = Jitterbug(random=random, task="face_direction", **kwargs)
+    environment_kwargs = environment_kwargs or {}
+    return control.Environment(
+        physics,
+        task,
+        time_limit=time_limit,
+        control_timestep=control_timestep,
+        **environment_kwargs
+    )
+
+
+@SUITE.add("benchmarking", "easy")
+def move_in_direction(
+        time_limit=DEFAULT_TIME_LIMIT,
+        control_timestep=DEFAULT_CONTROL_TIMESTEP,
+        random=None,
+        environment_kwargs=None,
+        **kwargs
+):
+    """Move the Jitterbug in a certain direction"""
+    physics = Physics.from_xml_string(*get_model_and_assets())
+    task = Jitterbug(random=random, task="move_in_direction", **kwargs)
+    environment_kwargs = environment_kwargs or {}
+    return control.Environment(
+        physics,
+        task,
+        time_limit=time_limit,
+        control_timestep=control_timestep,
+        **environment_kwargs
+    )
+
+
+@SUITE.add("benchmarking", "hard")
+def move_to_position(
+        time_limit=DEFAULT_TIME_LIMIT,
+        control_timestep=DEFAULT_CONTROL_TIMESTEP,
+        random=None,
+        environment_kwargs=None,
+        **kwargs
+):
+    """Move the Jitterbug to a certain XYZ position"""
+    physics = Physics.from_xml_string(*get_model_and_assets())
+    task = Jitterbug(random=random, task="move_to_position", **kwargs)
+    environment_kwargs = environment_kwargs or {}
+    return control.Environment(
+        physics,
+        task,
+        time_limit=time_limit,
+        control_timestep=control_timestep,
+        **environment_kwargs
+    )
+
+
+@SUITE.add("benchmarking", "hard")
+def move_to_pose(
+        time_limit=DEFAULT_TIME_LIMIT,
+        control_timestep=DEFAULT_CONTROL_TIMESTEP,
+        random=None,
+        environment_kwargs=None,
+        **kwargs
+):
+    """Move the Jitterbug to a certain XYZRPY pose"""
+    physics = Physics.from_xml_string(*get_model_and_assets())
+    task = Jitterbug(random=random, task="move_to_pose", **kwargs)
+    environment_kwargs = environment_kwargs or {}
+    return control.Environment(
+        physics,
+        task,
+        time_limit=time_limit,
+        control_timestep=control_timestep,
+        **environment_kwargs
+    )
+
+
+# Names of the tasks registered above, computed once at import time so
+# constructing a task doesn't pay an O(module-size) reflection scan
+TASK_NAMES = tuple(sorted(SUITE._tasks))
+
+
+def _cached_per_step(method):
+    """Memoize a Physics derivation for the duration of one physics step
+
+    get_observation and get_reward derive the same quantities (yaw angles,
+    frame transforms) several times within a single control step; caching
+    them keyed on the simulation clock lets every consumer share one
+    computation. The cache invalidates automatically when the clock moves,
+    and is cleared explicitly on episode initialization (where state
+    changes without the clock advancing).
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self):
+        cache = self.__dict__.setdefault('_step_cache', {})
+        t = self.data.time
+        if cache.get('_time') != t:
+            cache.clear()
+            cache['_time'] = t
+        if name not in cache:
+            cache[name] = method(self)
+        return cache[name]
+
+    return wrapper
+
+
+class Physics(mujoco.Physics):
+    """Physics simulation with additional features"""
+
+    def invalidate_step_cache(self):
+        """Drop any per-step cached derivations (see _cached_per_step)"""
+        self.__dict__.pop('_step_cache', None)
+
+    def _bind_named_views(self):
+        """Bind views of the named data arrays once per instance
+
+        dm_control's named indexing performs a dict+string lookup on every
+        access, but the views it returns alias data buffers that are stable
+        for the lifetime of the Physics, so they can be bound once and each
+        subsequent access is a plain attribute read.
+        """
+        named_data = self.named.data
+        self._qpos_root = named_data.qpos["root"]
+        self._qvel_root = named_data.qvel["root"]
+        self._qpos_motor = named_data.qpos["jointMass"]
+        self._qvel_motor = named_data.qvel["jointMass"]
+        self._target_xpos = named_data.geom_xpos["target"]
+        self._target_xquat = named_data.xquat["target"]
+        self._xmat_jitterbug = named_data.xmat["jitterbug"]
+        self._jitterbug_linvel = named_data.sensordata["jitterbug_framelinvel"]
+
+    def jitterbug_position(self):
+        """Get the full jitterbug pose vector"""
+        try:
+            return self._qpos_root
+        except AttributeError:
+            self._bind_named_views()
+            return self._qpos_root
+
+    def jitterbug_position_xyz(self):
+        """Get the XYZ position of the Jitterbug"""
+        return self.jitterbug_position()[:3]
+
+    def jitterbug_position_quat(self):
+        """Get the orientation of the Jitterbug"""
+        return self.jitterbug_position()[3:]
+
+    @_cached_per_step
+    def jitterbug_direction_yaw(self):
+        """Get the yaw angle of the Jitterbug in radians
+
+        Returns:
+            (float): Yaw angle of the Jitterbug in radians on the range
+                [-pi, pi]
+        """
+        q0, q1, q2, q3 = self.jitterbug_position_quat()
+
+        # Jitterbug model faces the -Y direction, so we rotate 90deg CW to
+        # align its face with the +X axis
+        return _quat_yaw(q0, q1, q2, q3) - math.pi / 2
+
+    def jitterbug_velocity(self):
+        """Get the full jitterbug velocity vector"""
+        try:
+            return self._qvel_root
+        except AttributeError:
+            self._bind_named_views()
+            return self._qvel_root
+
+    def jitterbug_velocity_xyz(self):
+        """Get the XYZ velocity of the Jitterbug"""
+        return self.jitterbug_velocity()[:3]
+
+    def jitterbug_velocity_rpy(self):
+        """Get the angular velocity of the Jitterbug"""
+        return self.jitterbug_velocity()[3:]
+
+    def motor_position(self):
+        """Get the motor angular position
+
+        NB: This function artificially rotates the motor frame so that 0deg is
+        facing forwards on the Jitterbug
+
+        Returns:
+            (float): The motor position in radians on the range [-pi, pi]
+        """
+
+        # Offset motor so 0deg is facing forwards on the jitterbug
+        try:
+            qpos_motor = self._qpos_motor
+        except AttributeError:
+            self._bind_named_views()
+            qpos_motor = self._qpos_motor
+        angle = qpos_motor + math.pi / 2
+
+        while angle > math.pi:
+            angle -= 2 * math.pi
+        while angle <= -math.pi:
+            angle += 2 * math.pi
+        return angle
+
+    def motor_velocity(self):
+        """Get the motor angular velocity"""
+        try:
+            return self._qvel_motor
+        except AttributeError:
+            self._bind_named_views()
+            return self._qvel_motor
+
+    def target_position(self):
+        """Get the full target pose vector
+
+        NB: the returned array is a reused buffer, overwritten on the
+        next call
+        """
+        try:
+            buf = self._target_pose_buf
+        except AttributeError:
+            buf = self._target_pose_buf = np.empty(7)
+        buf[:3] = self.target_position_xyz()
+        buf[3:] = self.target_position_quat()
+        return buf
+
+    def target_position_xyz(self):
+        """Get the XYZ position of the target"""
+        try:
+            return self._target_xpos
+        except AttributeError:
+            self._bind_named_views()
+            return self._target_xpos
+
+    def target_position_quat(self):
+        """Get the orientation of the target"""
+        try:
+            return self._target_xquat
+        except AttributeError:
+            self._bind_named_views()
+            return self._target_xquat
+
+    def target_direction_yaw(self):
+        """Get the yaw angle of the target in radians
+
+        Returns:
+            (float): Yaw angle of the target in radians on the range
+                [-pi, pi]
+        """
+        q = self.target_position_quat()
+
+        # The target orientation only changes on episode init, so memoize
+        # the yaw on the quaternion value itself rather than the step
+        # clock. q is a view that mutates in place, so the key is a
+        # snapshot copy compared by value
+        try:
+            if np.array_equal(q, self._last_target_quat):
+                return self._last_target_yaw
+        except AttributeError:
+            self._last_target_quat = np.empty(4)
+
+        self._last_target_quat[:] = q
+        self._last_target_yaw = yaw = _quat_yaw(q[0], q[1], q[2], q[3])
+        return yaw
+
+    @_cached_per_step
+    def target_position_in_jitterbug_frame(self):
+        """Find XYZ position of the target in the Jitterbug frame
+
+        NB: +X in Jitterbug frame is to the LHS, +Y in Jitterbug frame is
+        backwards
+        """
+
+        # Find relative target position
+        target_pos = self.target_position_xyz() - self.jitterbug_position_xyz()
+
+        # Get the Jitterbug frame rotation matrix
+        jitterbug_rot_mat = np.zeros(9)
+        mjlib.mju_quat2Mat(jitterbug_rot_mat, self.jitterbug_position_quat())
+
+        # Apply inverse transform to put target in JB frame
+        return np.linalg.inv(jitterbug_rot_mat.reshape((3, 3))) @ target_pos
+
+    @_cached_per_step
+    def jitterbug_velocity_in_target_frame(self):
+        """Find the XYZ velocity of the Jitterbug in the target frame"""
+
+        # Get the Jitterbug global frame velocity
+        try:
+            jitterbug_vel = self._jitterbug_linvel
+        except AttributeError:
+            self._bind_named_views()
+            jitterbug_vel = self._jitterbug_linvel
+
+        # Get the target frame rotation matrix
+        target_rot_mat = np.zeros(9)
+        mjlib.mju_quat2Mat(target_rot_mat, self.target_position_quat())
+
+        # Apply inverse rotation to put velocity in target frame
+        return np.linalg.inv(target_rot_mat.reshape((3, 3))) @ jitterbug_vel
+
+    @_cached_per_step
+    def angle_jitterbug_to_target(self):
+        """Gets the relative yaw angle from Jitterbug heading to the target
+
+        Returns:
+            (numpy array): The relative angle in radians from the target to
+                the Jitterbug on the range [-pi, pi], as a 1-element array.
+                NB: the array is a reused buffer, overwritten on the next
+                physics step
+        """
+        angle = _wrap_angle(
+            self.target_direction_yaw() - self.jitterbug_direction_yaw()
+        )
+
+        # Write into a reused 1-element buffer rather than allocating a
+        # fresh array on every call
+        try:
+            buf = self._angle_buf
+        except AttributeError:
+            buf = self._angle_buf = np.empty(1)
+        buf[0] = angle
+        return buf
+
+
+class PrefixStateCache(object):
+    """Caches physics states keyed by executed action prefix
+
+    Planners (beam or Monte-Carlo style search) and ensemble rollouts
+    repeatedly replay the same action prefix from the start of an episode.
+    Storing the physics state reached after each executed prefix lets an
+    identical prefix be resumed from the cached state instead of being
+    re-simulated step by step.
+
+    Typical use from a planner loop:
+
+        n = cache.longest_cached_prefix(actions)
+        if n > 0:
+            cache.restore(physics, actions[:n])
+        for k in range(n, len(actions)):
+            # step physics with actions[k] ...
+            cache.store(actions[:k + 1], physics)
+    """
+
+    def __init__(self, max_entries=4096):
+        """Constructor
+
+        Args:
+            max_entries (int): Maximum number of states to retain; further
+                stores are ignored once full
+        """
+        self._states = {}
+        self._max_entries = max_entries
+
+    @staticmethod
+    def _key(action_prefix):
+        return tuple(np.asarray(action_prefix).ravel())
+
+    def store(self, action_prefix, physics):
+        """Record the state reached after executing action_prefix"""
+        if len(self._states) >= self._max_entries:
+            return
+        self._states[self._key(action_prefix)] = (
+            physics.get_state().copy(),
+            physics.data.time
+        )
+
+    def restore(self, physics, action_prefix):
+        """Rewind physics to the state cached for action_prefix
+
+        Returns:
+            (bool): True if the prefix was cached and restored
+        """
+        entry = self._states.get(self._key(action_prefix))
+        if entry is None:
+            return False
+        state, t = entry
+        with physics.reset_context():
+            physics.set_state(state)
+            physics.data.time = t
+        physics.invalidate_step_cache()
+        return True
+
+    def longest_cached_prefix(self, actions):
+        """Find the length of the longest cached prefix of an action sequence
+
+        Probes from the full sequence length downwards.
+
+        Returns:
+            (int): Length of the longest cached prefix, 0 if none
+        """
+        for n in range(len(actions), 0, -1):
+            if self._key(actions[:n]) in self._states:
+                return n
+        return 0
+
+    def clear(self):
+        """Drop all cached states (e.g. on episode re-initialization)"""
+        self._states.clear()
+
+
+class Jitterbug(base.Task):
+    """A jitterbug `Task`"""
+
+    # Approximate Min, Max ranges for observation dimensions
+    _NORM_ALL = np.array([
+        # Position
+        [-2.0,    2.0],                         # X
+        [-2.0,    2.0],                         # Y
+        [ 0.0,    0.1],                         # Z
+        [-1.0,    1.0],                         # Qx
+        [-1.0,    1.0],                         # Qy
+        [-1.0,    1.0],                         # Qz
+        [-1.0,    1.0],                         # Qw
+
+        # Velocity
+        [-1.0,    1.0],                         # Vx
+        [-1.0,    1.0],                         # Vy
+        [-1.0,    1.0],                         # Vz
+        [-35.0,   35.0],                        # Vr
+        [-35.0,   35.0],                        # Vp
+        [-35.0,   35.0],                        # Vy
+
+        # Motor position
+        [-np.pi, np.pi],                        # motor angle
+
+        # Motor velocity
+        [-180.0, 180.0],                        # motor velocity
+    ])
+
+    # Approximate Min, max ranges for observation dimensions specific to tasks
+    _NORM_TASKS = dict(
+        move_from_origin=np.array([]),                    # No extra dimensions
+        face_direction=np.array([
+            [-np.pi, np.pi]                     # Relative Yaw angle
+        ]),
+        move_in_direction=np.array([
+            [-np.pi, np.pi],                    # Relative Yaw angle
+            [-1.0, 1.0],                        # Relative Vx
+            [-1.0, 1.0],                        # Relative Vy
+            [-1.0, 1.0]                         # Relative Vz
+        ]),
+        move_to_position=np.array([
+            [-3.0, 3.0],                        # Relative X
+            [-3.0, 3.0],                        # Relative Y
+            [-0.1, 0.1]                         # Relative Z
+        ]),
+        move_to_pose=np.array([
+            [-3.0, 3.0],                        # Relative X
+            [-3.0, 3.0],                        # Relative Y
+            [-0.1, 0.1],                        # Relative Z
+            [-np.pi, np.pi]                     # Relative Yaw Angle
+        ])
+    )
+
+    def __init__(
+            self,
+            random=None,
+            task="move_from_origin",
+            random_pose=True,
+            norm_obs=False
+    ):
+        """Initialize an instance of the `Jitterbug` domain
+
+        Args:
+            random (numpy.random.RandomState): Options are;
+                - numpy.random.RandomState instance
+                - An integer seed for creating a new `RandomState`
+                - None to select a seed automatically (default)
+            task (str): Specifies which task to configure. Options are;
+                - move_from_origin
+                - face_direction
+                - move_in_direction
+                - move_to_position
+                - move_to_pose
+            random_pose (bool): If true, initialize the Jitterbug with a random
+                pose to break symmetries
+            norm_obs (bool): If true, observations will be approximately normalized
+                to the range (-1, 1)
+        """
+
+        self.feature_names = [
+            'root_x',
+            'root_y',
+           'root_z',
+            'root_qx',
+            'root_qy',
+           ' root_qz',
+            'root_qw',
+            'root_vx',
+            'root_vy',
+            'root_vz',
+            'root_roll',
+            'root_pitch',
+            'root_yaw',
+            'motor_position',
+            'motor_velocity',
+            'angle_to_target'
+                    ]
+
+        self.task_names = list(TASK_NAMES)
+        assert task in TASK_NAMES, \
+            "Invalid task {}, options are {}".format(task, self.task_names)
+
+        self.task = task
+        self.random_pose = random_pose
+        self.norm_obs = norm_obs
+
+        # Bind the task-specific episode-init, observation and reward
+        # handlers once, so the per-step and per-reset methods make one
+        # indirect call instead of re-running a string-compare ladder
+        self._init_fn = {
+            "move_from_origin": self._init_move_from_origin,
+            "face_direction": self._init_face_direction,
+            "move_in_direction": self._init_move_in_direction,
+            "move_to_position": self._init_move_to_position,
+            "move_to_pose": self._init_move_to_pose
+        }[task]
+        self._obs_extra_fn = {
+            "move_from_origin": self._obs_extra_move_from_origin,
+            "face_direction": self._obs_extra_face_direction,
+            "move_in_direction": self._obs_extra_move_in_direction,
+            "move_to_position": self._obs_extra_move_to_position,
+            "move_to_pose": self._obs_extra_move_to_pose
+        }[task]
+        self._reward_fn = {
+            "move_from_origin": self._reward_move_from_origin,
+            "face_direction": self._reward_face_direction,
+            "move_in_direction": self._reward_move_in_direction,
+            "move_to_position": self._reward_move_to_position,
+            "move_to_pose": self._reward_move_to_pose
+        }[task]
+        super(Jitterbug, self).__init__(random=random)
+
+        # Episode-init randomness is drawn from the task RNG in batches;
+        # see _next_episode_rand
+        self._rand_buf = None
+        self._rand_idx = 0
+
+        #self.pickleFile = open("observations.pkl", "wb")
+        self.principalVectors = np.array([[0.0049, 0.0171, -0.0001, -0.0001, 0.0003, 0, 0, 0],
+                                          [0.0242, -0.0042, -0.0002, 0.0001, 0.0001, 0, 0, 0],
+                                          [-0.0002, -0.0001, 0.0003, 0, 0, 0, 0, 0],
+                                          [0.1224, 0.9907, 0.0519, -0.0072, 0.0094, -0.0001, 0.0001, 0.0001],
+                                          [-0.0019, 0.0201, 0.0014, -0.0006, 0.0003, 0, -0.0002, 0],
+                                          [0.0224, -0.0022, -0.0009, 0, -0.0001, -0.0003, 0, 0],
+                                          [0.9918, -0.1215, -0.0179, 0.0052, 0.0022, 0, -0.0001, -0.0002],
+                                          [0.0014, 0.0043, 0.0001, 0.0003, 0.0001, 0.0002, 0.0001, 0],
+                                          [0.0066, -0.0011, 0.0001, -0.0002, 0, 0.0001, -0.0001, 0],
+                                          [0.0001, 0, -0.0002, 0.0001, -0.0001, 0.0012, 0, 0],
+                                          [-0.0002, 0, 0.0004, 0.0284, 0.0096, -0.9995, -0.0035, -0.0003],
+                                          [-0.0003, 0.0004, -0.0014, 0.0766, 0.0141, -0.0011, 0.997, 0.0007],
+                                          [0.0038, 0.0067, 0.0441, 0, -0.9988, -0.0096, 0.0142, -0.0046],
+                                          [0.0043, -0.0079, 0.0022, -0.9966, 0.0014, -0.0286, 0.0765, 0],
+                                          [0.0002, -0.0004, 0.0057, -0.0001, -0.0044, -0.0003, -0.0007, 1],
+                                          [-0.0113, 0.054, -0.9975, -0.0027, -0.0438, -0.0009, -0.0006, 0.0055]])
+
+        self.principalVectors4dim = np.array([[0.0003, 0, 0, 0],
+                                              [0.0001, 0, 0, 0],
+                                              [0, 0, 0, 0],
+                                              [0.0094, -0.0001, 0.0001, 0.0001],
+                                              [0.0003, 0, -0.0002, 0],
+                                              [-0.0001, -0.0003, 0, 0],
+                                              [0.0022, 0, -0.0001, -0.0002],
+                                              [0.0001, 0.0002, 0.0001, 0],
+                                              [0, 0.0001, -0.0001, 0],
+                                              [-0.0001, 0.0012, 0, 0],
+                                              [0.0096, -0.9995, -0.0035, -0.0003],
+                                              [0.0141, -0.0011, 0.997, 0.0007],
+                                              [-0.9988, -0.0096, 0.0142, -0.0046],
+                                              [0.0014, -0.0286, 0.0765, 0],
+                                              [-0.0044, -0.0003, -0.0007, 1],
+                                              [-0.0438, -0.0009, -0.0006, 0.0055]])
+
+        self.use_autoencoder = False
+        self.use_several_autoencoders = False
+        self.use_denoising_autoencoder = False
+        self.use_VAE = True
+        self.train_autoencoder = False
+        self.use_denoising_autoencoder15 = False
+        self.use_autoencoder15 = False
+        self.use_autoencoder13 = False
+
+        self.normalize01 = False
+
+        if self.use_autoencoder:
+            g = tf.Graph()
+            with g.as_default():
+                sess = tf.Session(graph=g)
+
+                self.session = sess
+                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=16,
+                                                                     lr=0.0005,
+                                                                     sess=self.session
+                                                                     )
+                i=32
+                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
+                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
+
+        if self.use_denoising_autoencoder:
+            g = tf.Graph()
+            with g.as_default():
+                sess = tf.Session(graph=g)
+
+                self.session = sess
+                self.jitterbug_autoencoder = denoising_autoencoder.Autoencoder(feature_dimension=19,
+                                                                     lr=0.0005,
+                                                                     sess=self.session
+                                                                     )
+                i=46
+                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
+                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
+
+        if self.use_VAE:
+            device = torch.device(
+                "cuda" if torch.cuda.is_available() and use_gpu
+                else "cpu"
+            )
+            self.jitterbug_autoencoder = VAE.VAE(data_size=19, latent_size=15).to(device)
+            optimizer = opt.Adam(self.jitterbug_autoencoder.parameters(), lr=1e-3)
+            path = "./VAE.pt"
+            self.jitterbug_autoencoder.load_autoencoder(path)
+            print("VAE loaded from "+path)
+
+        if self.use_denoising_autoencoder15:
+            g = tf.Graph()
+            with g.as_default():
+                sess = tf.Session(graph=g)
+
+                self.session = sess
+                self.jitterbug_autoencoder = denoising_autoencoder.Autoencoder(feature_dimension=15,
+                                                                     lr=0.0005,
+                                                                     sess=self.session,
+                                                                     )
+                i=28
+                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
+                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
+
+        if self.use_autoencoder15:
+            g = tf.Graph()
+            with g.as_default():
+                sess = tf.Session(graph=g)
+
+                self.session = sess
+                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=15,
+                                                                     lr=0.0005,
+                                                                     sess=self.session
+                                                                     )
+                i=29
+                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
+                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
+
+        if self.use_autoencoder13:
+            g = tf.Graph()
+            with g.as_default():
+                sess = tf.Session(graph=g)
+
+                self.session = sess
+                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=13,
+                                                                     lr=0.0005,
+                                                                     sess=self.session
+                                                                     )
+                i=30
+                self.jitterbug_autoencoder.load_autoencoder(f"./autoencoder_model{i}.ckpt")
+                print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
+
+
+        if self.train_autoencoder:
+            g = tf.Graph()
+            with g.as_default():
+                sess = tf.Session(graph=g)
+
+                self.session = sess
+                self.jitterbug_autoencoder = autoencoder.Autoencoder(feature_dimension=16,
+                                                                            lr=0.001,
+                                                                            sess=self.session
+                                                                            )
+
+        if self.use_several_autoencoders:
+            self.index_list = [11,15,16,17,18]
+            self.num_autoencoders = len(self.index_list)
+            self.autoencoder_list = []
+            self.session_list = []
+            for i in self.index_list:
+                #Generate a session for each autoencoder
+                g_i = tf.Graph()
+                with g_i.as_default():
+                    session_i = tf.Session(graph=g_i)
+                    self.session_list.append(session_i)
+                    jitterbug_autoencoder_i = autoencoder.Autoencoder(feature_dimension=16,
+                                                                      lr=0.0005,
+                                                                      sess=session_i
+                                                                      )
+                    print(f"load autoencoder {i} from file ./autoencoder_model{i}.ckpt")
+                    jitterbug_autoencoder_i.load_autoencoder(f"./autoencoder_model{i}.ckpt")
+                    self.autoencoder_list.append(jitterbug_autoencoder_i)
+
+
+        self.extremum = np.array([[float('Inf'),-float('Inf')]]*16)
+        self.N_features =len(self.extremum)
+
+
+        self.counter = 0
+        self.observation_buffer = []
+        self.batch_size = 1000
+        self.buffer_size = int(1e4)
+
+        # Reused buffer for the target quaternion written on episode init
+        self._target_quat_buf = np.zeros(4)
+
+        # Pay the one-off numba compile cost for the hot kernels here
+        # rather than on the first env step
+        _norm_obs(
+            np.zeros(Jitterbug._NORM_ALL.shape[0]),
+            Jitterbug._NORM_ALL[:, 0],
+            Jitterbug._NORM_ALL[:, 1]
+        )
+        _wrap_angle(_quat_yaw(1.0, 0.0, 0.0, 0.0))
+
+    # Number of episode resets worth of uniform samples to draw at once
+    _RAND_BATCH = 256
+
+    def _next_episode_rand(self):
+        """Pop one row of uniform(0, 1) samples for episode initialization
+
+        Drawing a (batch, 6) block from the task RNG up front amortizes the
+        per-call RandomState overhead over many resets. The columns are
+        (angle, radius, yaw, rotation angle, axis x, axis y), each scaled to
+        its range at the point of use.
+        """
+        if self._rand_buf is None or self._rand_idx >= len(self._rand_buf):
+            self._rand_buf = self.random.uniform(size=(Jitterbug._RAND_BATCH, 6))
+            self._rand_idx = 0
+        row = self._rand_buf[self._rand_idx]
+        self._rand_idx += 1
+        return row
+
+    def _set_target_yaw(self, physics, yaw):
+        """Point the target at a given yaw angle
+
+        Writes the quaternion into a reused buffer rather than building a
+        fresh array on every episode reset.
+        """
+        self._target_quat_buf[0] = math.cos(yaw / 2)
+        self._target_quat_buf[3] = math.sin(yaw / 2)
+        physics.named.model.body_quat["target"] = self._target_quat_buf
+
+    def _init_move_from_origin(self, physics, angle, radius, yaw):
+
+        # Hide the target orientation as it is not needed for this task
+        physics.named.model.geom_rgba["targetPointer", 3] = 0
+
+    def _init_face_direction(self, physics, angle, radius, yaw):
+
+        # Randomize target orientation
+        self._set_target_yaw(physics, yaw)
+
+    def _init_move_in_direction(self, physics, angle, radius, yaw):
+
+        # Randomize target orientation
+        self._set_target_yaw(physics, yaw)
+
+    def _init_move_to_position(self, physics, angle, radius, yaw):
+
+        # Hide the target orientation indicator as it is not needed
+        physics.named.model.geom_rgba["targetPointer", 3] = 0
+
+        # Randomize target position
+        physics.named.model.body_pos["target", "x"] = radius * math.cos(angle)
+        physics.named.model.body_pos["target", "y"] = radius * math.sin(angle)
+
+    def _init_move_to_pose(self, physics, angle, radius, yaw):
+
+        # Randomize full target pose
+        physics.named.model.body_pos["target", "x"] = radius * math.cos(angle)
+        physics.named.model.body_pos["target", "y"] = radius * math.sin(angle)
+        self._set_target_yaw(physics, yaw)
+
+    def initialize_episode(self, physics):
+        """Sets the state of the environment at the start of each episode
+        """
+
+        # Use reset context to ensure changes are applied immediately
+        with physics.reset_context():
+
+            # Configure target based on task. All episode randomness comes
+            # from the task RNG (the yaw and pose draws previously used the
+            # np.random module, bypassing the seed)
+            u = self._next_episode_rand()
+            angle = 2 * math.pi * u[0]
+            radius = .05 + .15 * u[1]
+            yaw = 2 * math.pi * u[2]
+
+            self._init_fn(physics, angle, radius, yaw)
+
+            if self.random_pose:
+                # Randomize Jitterbug orientation to break symmetries
+                rotation_angle = u[3] * 2 * math.pi
+                rotation_axis = np.concatenate((
+                    u[4:6] * 0.05 - 0.025,
+                    (1.0,)
+                ))
+                rotation_axis /= np.linalg.norm(rotation_axis)
+                physics.named.data.qpos["root"][3:] = np.concatenate((
+                    (math.cos(rotation_angle / 2),),
+                    math.sin(rotation_angle / 2) * rotation_axis
+                ))
+
+        # The reset changed state without advancing the simulation clock,
+        # so any per-step cached derivations are stale
+        physics.invalidate_step_cache()
+
+        super(Jitterbug, self).initialize_episode(physics)
+
+    @staticmethod
+    def _norm(v, min, max):
+        """Normalize a vector to the range (-1.0, 1.0)"""
+        return _norm_obs(v, min, max)
+
+    def get_observation(self, physics):
+        """Returns an observation of the state and the target position
+        """
+        # Must stay an OrderedDict: dm_control's flatten_observation keeps
+        # insertion order only for OrderedDict and sorts the keys of any
+        # other mapping, which would silently permute the flattened vector
+        obs = collections.OrderedDict()
+        obs['position'] = Jitterbug._norm(
+            physics.jitterbug_position(),
+            Jitterbug._NORM_ALL[0:7, 0],
+            Jitterbug._NORM_ALL[0:7, 1]
+        )
+        obs['velocity'] = Jitterbug._norm(
+            physics.jitterbug_velocity(),
+            Jitterbug._NORM_ALL[7:13, 0],
+            Jitterbug._NORM_ALL[7:13, 1]
+        )
+
+        obs['motor_position'] = Jitterbug._norm(
+            physics.motor_position(),
+            Jitterbug._NORM_ALL[13, 0],
+            Jitterbug._NORM_ALL[13, 1]
+        )
+
+        obs['motor_velocity'] = Jitterbug._norm(
+            physics.motor_velocity(),
+            Jitterbug._NORM_ALL[14, 0],
+            Jitterbug._NORM_ALL[14, 1]
+        )
+
+        # Add the task-specific observation dimensions
+        self._obs_extra_fn(physics, obs)
+
+        self.counter += 1
+
+        if self.use_autoencoder or self.use_several_autoencoders or self.use_denoising_autoencoder or self.train_autoencoder or self.use_denoising_autoencoder15 or self.use_autoencoder15 or self.use_autoencoder13 or self.use_VAE:
+            obs = self.encode_obs(obs)
+
+        return obs
+
+    def _obs_extra_move_from_origin(self, physics, obs):
+        # Jitterbug position is a sufficient observation for this task
+        pass
+
+    def _obs_extra_face_direction(self, physics, obs):
+
+        # Store the relative target yaw angle
+        obs['angle_to_target'] = Jitterbug._norm(
+            physics.angle_jitterbug_to_target(),
+            Jitterbug._NORM_TASKS['face_direction'][0, 0],
+            Jitterbug._NORM_TASKS['face_direction'][0, 1]
+        )
+
+    def _obs_extra_move_in_direction(self, physics, obs):
+
+        # Store the relative target yaw angle
+        obs['angle_to_target'] = Jitterbug._norm(
+            physics.angle_jitterbug_to_target(),
+            Jitterbug._NORM_TASKS['move_in_direction'][0, 0],
+            Jitterbug._NORM_TASKS['move_in_direction'][0, 1]
+        )
+
+        # Store the speed in the target frame
+        obs['speed_in_target_frame'] = Jitterbug._norm(
+            physics.jitterbug_velocity_in_target_frame(),
+            Jitterbug._NORM_TASKS['move_in_direction'][1:, 0],
+            Jitterbug._NORM_TASKS['move_in_direction'][1:, 1]
+        )
+
+    def _obs_extra_move_to_position(self, physics, obs):
+
+        # Store the relative target XYZ position in JB frame
+        obs['target_in_jitterbug_frame'] = Jitterbug._norm(
+            physics.target_position_in_jitterbug_frame(),
+            Jitterbug._NORM_TASKS['move_to_position'][:, 0],
+            Jitterbug._NORM_TASKS['move_to_position'][:, 1]
+        )
+
+    def _obs_extra_move_to_pose(self, physics, obs):
+
+        # Store the relative target XYZ position in JB frame
+        obs['target_in_jitterbug_frame'] = Jitterbug._norm(
+            physics.target_position_in_jitterbug_frame(),
+            Jitterbug._NORM_TASKS['move_to_pose'][0:3, 0],
+            Jitterbug._NORM_TASKS['move_to_pose'][0:3, 1]
+        )
+
+        # Store the relative target yaw angle
+        obs['angle_to_target'] = Jitterbug._norm(
+            physics.angle_jitterbug_to_target(),
+            Jitterbug._NORM_TASKS['move_to_pose'][3, 0],
+            Jitterbug._NORM_TASKS['move_to_pose'][3, 1]
+        )
+
+    def obsdict2vec(self, obs):
+        """Convert an observation dictionary to vector
+
+        Args:
+            obs (dict): Observation dictionary
+
+        Returns:
+            (numpy array): Observation vector (size depends on task)
+            (list): Observation vector column names
+        """
+
+        # All tasks start with 15 dimensions
+        obs_vec = np.concatenate((
+            obs['position'],            # 3 dims (X, Y, Z, Qx, Qy, Qz, Qw)
+            obs['velocity'],            # 6 dims (Vx, Vy, Vz, r, p, y)
+            obs['motor_position'],      # 1 dim (angle)
+            obs['motor_velocity'],      # 1 dim (angular vel)
+        ))
+
+        columns = [
+            "X", "Y", "Z", "QuatX", "QuatY", "QuatZ", "QuatW",
+            "VelX", "VelY", "VelZ", "VelRoll", "VelPitch", "VelYaw",
+            "MotorYaw",
+            "MotorVelYaw"
+        ]
+
+        # The task definition adds 0 to 4 dimensions
+        if self.task == "move_from_origin":
+            # Jitterbug position is a sufficient observation for this task
+            pass
+
+        elif self.task == "face_direction":
+
+            obs_vec = np.concatenate((
+                obs_vec,
+                obs['angle_to_target'],                  # 1 dim (relative yaw angle)
+            ))
+            columns.append("TargetYaw")
+
+        elif self.task == "move_in_direction":
+
+            obs_vec = np.concatenate((
+                obs_vec,
+                obs['angle_to_target'],                  # 1 dim (relative yaw angle)
+                obs['speed_in_target_frame']             # 3 dims (relative Vx, Vy, Vz)
+            ))
+            columns.append("TargetYaw")
+            columns.append("TargetVelX")
+            columns.append("TargetVelY")
+            columns.append("TargetVelZ")
+
+        elif self.task == "move_to_position":
+
+            obs_vec = np.concatenate((
+                obs_vec,
+                obs['target_in_jitterbug_frame'],       # 3 dims (relative X, Y, Z)
+            ))
+            columns.append("TargetX")
+            columns.append("TargetY")
+            columns.append("TargetZ")
+
+        elif self.task == "move_to_pose":
+
+            obs_vec = np.concatenate((
+                obs_vec,
+                obs['target_in_jitterbug_frame'],       # 3 dims (relative X, Y, Z)
+                obs['angle_to_target']                  # 1 dim (relative yaw angle)
+            ))
+            columns.append("TargetX")
+            columns.append("TargetY")
+            columns.append("TargetZ")
+            columns.append("TargetYaw")
+
+        return obs_vec, columns
+
+    def heading_reward(self, physics):
+        """Compute a reward for facing a certain direction
+
+        Returns:
+            (float): Angular reward on [0, 1]
+        """
+        return rewards.tolerance(
+            physics.angle_jitterbug_to_target()[0],
+            bounds=(0, 0),
+            margin=math.pi / 2,
+            value_at_margin=0,
+            sigmoid='cosine'
+        )
+
+    def velocity_reward(self, physics):
+        """Compute a reward for moving in a certain direction
+
+        Returns:
+            (float): Velocity reward on [0, 1]
+        """
+        return rewards.tolerance(
+            physics.jitterbug_velocity_in_target_frame()[0],
+            bounds=(TARGET_SPEED, float('inf')),
+            margin=TARGET_SPEED,
+            value_at_margin=0,
+            sigmoid='linear'
+        )
+
+    def position_reward(self, physics):
+        """Compute a reward for moving to a certain position
+
+        Returns:
+            (float): Position reward on [0, 1]
+        """
+        # Inline the 3-vector norm; np.linalg.norm pays a full ufunc
+        # dispatch for three elements
+        v = physics.target_position_in_jitterbug_frame()
+        return rewards.tolerance(
+            math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2]),
+            bounds=(0, 0),
+            margin=0.05
+        )
+
+    def upright_reward(self, physics):
+        """Reward Jitterbug for remaining upright"""
+
+        # Dot product of the Jitterbug Z axis with the global Z: the 'zz'
+        # entry (index 8) of the cached rotation matrix view. Extract a
+        # plain float so the tolerance math runs on a Python scalar rather
+        # than a 0-d numpy array
+        try:
+            z = physics._xmat_jitterbug[8]
+        except AttributeError:
+            physics._bind_named_views()
+            z = physics._xmat_jitterbug[8]
+        return rewards.tolerance(float(z), bounds=(1, 1), margin=0.5)
+
+    def _reward_move_from_origin(self, physics):
+        return 1 - self.position_reward(physics)
+
+    def _reward_face_direction(self, physics):
+        return self.heading_reward(physics)
+
+    def _reward_move_in_direction(self, physics):
+        return self.velocity_reward(physics)
+
+    def _reward_move_to_position(self, physics):
+        return self.position_reward(physics)
+
+    def _reward_move_to_pose(self, physics):
+        # Use multiplicative reward
+        return (
+                self.position_reward(physics) *
+                self.heading_reward(physics)
+        )
+
+    def get_reward(self, physics):
+
+        r = self._reward_fn(physics)
+
+        # Reward Jitterbug for staying upright. Skip when the task reward
+        # is already zero: the upright factor can't change the result and
+        # its named xmat lookup is not cheap
+        if r != 0.0:
+            r *= self.upright_reward(physics)
+        # print(r)
+        return r
+
+    def encode_obs(self, obs):
+        obs_line = []
+        for key in obs:
+            obs_line.append(obs[key])
+        obsArray = np.concatenate(obs_line)
+        if self.train_autoencoder:
+            if self.normalize01:
+                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs01(obsArray))]
+            else:
+                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs(obsArray))]
+            self.observation_buffer.insert(0, norm_obs[0]) #Add observation to buffer
+
+            while len(self.observation_buffer)>self.buffer_size:
+                self.observation_buffer.pop() #Remove the oldest observations from the buffer
+
+            encoded_obs = self.jitterbug_autoencoder.encode(norm_obs)
+            encoded_obs_dict = {'observations': np.array(encoded_obs)}
+            if self.counter % self.batch_size == 0:
+                self.update_autoencoder()
+
+        if self.use_autoencoder or self.use_denoising_autoencoder:
+            encoded_obs = self.jitterbug_autoencoder.encode([obsArray])
+            encoded_obs_dict = {'observations': np.array(encoded_obs)}
+
+        if self.use_VAE:
+            encoded_obs = self.jitterbug_autoencoder.encode(torch.Tensor(obsArray))
+            encoded_obs_dict = {'observations': np.array(encoded_obs)}
+
+        if self.use_denoising_autoencoder15 or self.use_autoencoder15:
+            if self.normalize01:
+                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs01(obsArray))]
+            else:
+                norm_obs = np.array(self.jitterbug_autoencoder.normalize_obs(obsArray))
+            #print("###############")
+            #print(norm_obs)
+            angle_to_target_norm = norm_obs[15]
+            norm_obs_15 = [norm_obs[:15]]
+            encoded_obs_15 = self.jitterbug_autoencoder.encode(norm_obs_15)
+            encoded_obs = np.concatenate((encoded_obs_15[0],[angle_to_target_norm]))
+            #print(encoded_obs)
+            encoded_obs_dict = {'observations': np.array(encoded_obs)}
+
+        if self.use_autoencoder13:
+            if self.normalize01:
+                norm_obs = [np.array(self.jitterbug_autoencoder.normalize_obs01(obsArray))]
+            else:
+                norm_obs = np.array(self.jitterbug_autoencoder.normalize_obs(obsArray))
+            #print("###############")
+            #print(norm_obs)
+            unchanged_features_norm = norm_obs[13:]
+            norm_obs_13 = [norm_obs[:13]]
+            encoded_obs_13 = self.jitterbug_autoencoder.encode(norm_obs_13)
+            encoded_obs = np.concatenate((encoded_obs_13[0], unchanged_features_norm))
+            #print(encoded_obs)
+            encoded_obs_dict = {'observations': np.array(encoded_obs)}
+
+        elif self.use_several_autoencoders:
+            encoded_list = []
+            norm_obs = [np.array(self.autoencoder_list[0].normalize_obs(obsArray))]
+            #print("###############")
+            #print(norm_obs)
+            for i in range(self.num_autoencoders):
+                encoded_list.append(np.array(self.autoencoder_list[i].encode(norm_obs)))
+            encoded_obs = sum(encoded_list)/self.num_autoencoders
+            #print(encoded_obs)
+            encoded_obs_dict = {'observations': encoded_obs}
+        return encoded_obs_dict
+
+    def update_autoencoder(self):
+        self.jitterbug_autoencoder.train_autoencoder(training_data=self.observation_buffer,
+                                                     num_epoch=1,
+                                                     batch_size=self.batch_size,
+                                                     )
+        print("Autoencoder updated")
+
+    def PCA(self, obs):
+        obsArray = np.concatenate(
+            (obs['position'], obs['velocity'], obs['motor_position'], obs['motor_velocity'], obs['angle_to_target']))
+        return {'observations': np.dot(obsArray, self.principalVectors4dim)}
+
+
+# Reused SoA gather buffers for batch_compute_rewards, keyed on pool size
+_BATCH_REWARD_BUFS = {}
+
+
+def batch_compute_rewards(physics_list, task):
+    """Compute rewards for a pool of parallel Physics in one numpy pass
+
+    Gathers the pose, velocity and target data of every Physics into
+    contiguous (N, ...) blocks, then evaluates the task reward as one
+    vectorized ufunc pipeline (rewards.tolerance accepts arrays), so the
+    per-env cost is a single gather rather than a full Python-dispatched
+    reward evaluation per environment.
+
+    Args:
+        physics_list (list): Physics instances to evaluate
+        task (str): The task name, as accepted by Jitterbug
+
+    Returns:
+        (numpy array): An (N,) array of rewards matching what
+            Jitterbug.get_reward returns on each Physics individually
+    """
+
+    n = len(physics_list)
+    try:
+        qpos, linvel, target_xpos, target_xquat, xmat_zz = \
+            _BATCH_REWARD_BUFS[n]
+    except KeyError:
+        qpos = np.empty((n, 7))
+        linvel = np.empty((n, 3))
+        target_xpos = np.empty((n, 3))
+        target_xquat = np.empty((n, 4))
+        xmat_zz = np.empty(n)
+        _BATCH_REWARD_BUFS[n] = (
+            qpos, linvel, target_xpos, target_xquat, xmat_zz
+        )
+
+    for i, physics in enumerate(physics_list):
+        try:
+            xmat = physics._xmat_jitterbug
+        except AttributeError:
+            physics._bind_named_views()
+            xmat = physics._xmat_jitterbug
+        qpos[i] = physics._qpos_root
+        linvel[i] = physics._jitterbug_linvel
+        target_xpos[i] = physics._target_xpos
+        target_xquat[i] = physics._target_xquat
+        xmat_zz[i] = xmat[8]
+
+    upright = rewards.tolerance(xmat_zz, bounds=(1, 1), margin=0.5)
+
+    if task in ("move_from_origin", "move_to_position", "move_to_pose"):
+        # Euclidean distance is rotation invariant, so the Jitterbug-frame
+        # transform used by the scalar path drops out of the norm
+        delta = target_xpos - qpos[:, :3]
+        dist = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        position = rewards.tolerance(dist, bounds=(0, 0), margin=0.05)
+
+    if task in ("face_direction", "move_to_pose"):
+        jitterbug_yaw = np.arctan2(
+            2.0 * (qpos[:, 4] * qpos[:, 5] + qpos[:, 3] * qpos[:, 6]),
+            qpos[:, 3] ** 2 + qpos[:, 4] ** 2
+            - qpos[:, 5] ** 2 - qpos[:, 6] ** 2
+        ) - np.pi / 2
+        target_yaw = np.arctan2(
+            2.0 * (target_xquat[:, 1] * target_xquat[:, 2]
+                   + target_xquat[:, 0] * target_xquat[:, 3]),
+            target_xquat[:, 0] ** 2 + target_xquat[:, 1] ** 2
+            - target_xquat[:, 2] ** 2 - target_xquat[:, 3] ** 2
+        )
+        angle = (target_yaw - jitterbug_yaw + np.pi) % (2.0 * np.pi) - np.pi
+        heading = rewards.tolerance(
+            angle,
+            bounds=(0, 0),
+            margin=np.pi / 2,
+            value_at_margin=0,
+            sigmoid='cosine'
+        )
+
+    if task == "move_from_origin":
+        r = 1 - position
+    elif task == "face_direction":
+        r = heading
+    elif task == "move_in_direction":
+        # X component of the velocity in the target frame: the first column
+        # of the target rotation matrix dotted with the world-frame velocity
+        q0 = target_xquat[:, 0]
+        q1 = target_xquat[:, 1]
+        q2 = target_xquat[:, 2]
+        q3 = target_xquat[:, 3]
+        vel_x = (
+            (q0 * q0 + q1 * q1 - q2 * q2 - q3 * q3) * linvel[:, 0]
+            + 2.0 * (q1 * q2 + q0 * q3) * linvel[:, 1]
+            + 2.0 * (q1 * q3 - q0 * q2) * linvel[:, 2]
+        )
+        r = rewards.tolerance(
+            vel_x,
+            bounds=(TARGET_SPEED, float('inf')),
+            margin=TARGET_SPEED,
+            value_at_margin=0,
+            sigmoid='linear'
+        )
+    elif task == "move_to_position":
+        r = position
+    elif task == "move_to_pose":
+        r = position * heading
+    else:
+        raise ValueError("Invalid task {}".format(task))
+
+    return r * upright
+
+
+def demo():
+    """Demonstrate the Jitterbug domain"""
+
+    # Get some imports
+    from dm_control import suite
+    from dm_control import viewer
+
+    # Add the jitterbug tasks to the suite
+    import jitterbug_dmc
+
+    # Load the Jitterbug domain
+    env = suite.load(
+        domain_name="jitterbug",
+        task_name="move_from_origin",
+        visualize_reward=True,
+        task_kwargs=dict(
+            #time_limit=float("inf")
+            norm_obs=True
+        )
+    )
+
+    def policy(ts):
+        """Constant policy"""
+        print(ts.observation)
+        return 0.8
+
+    # Dance, jitterbug, dance!
+    viewer.launch(
+        env,
+        policy=policy,
+        title="Jitterbug Demo"
+    )
+
+
+if __name__ == '__main__':
+    demo()